@@ -2,13 +2,24 @@
 
 from datetime import datetime
 from dotenv.main import load_dotenv
+from hashlib import sha256
+from typing import Optional
+from utils.archive import CODECS
+from utils.catalog import BlobCatalog
+from utils.cluster import Lease, fetch_shard_count, shard_ranges
+from utils.failures import FailureCache
+from utils.locks import RunCoordinator, UserLocks
 from utils.logger import Logger
+from utils.scheduler import JobScheduler
+from utils.manifest import ManifestIndex
+from utils.webserver import DownloadServer
 
 import aiohttp
 import aiopath
 import aiosqlite
 import asyncio
 import discord
+import multiprocessing
 import ujson
 import os
 import shutil
@@ -16,7 +27,11 @@ import sys
 import time
 
 
-async def startup():
+async def startup(
+    cluster: Optional[int] = None,
+    shard_ids: Optional[list[int]] = None,
+    shard_count: Optional[int] = None,
+):
     if sys.version_info[:2] < (3, 9):
         sys.exit('[ERROR] AutoTSS requires Python 3.9 or higher. Exiting.')
 
@@ -62,6 +77,78 @@ async def startup():
             "[ERROR] Bot token not set in 'AUTOTSS_TOKEN' environment variable. Exiting."
         )
 
+    try:
+        tsschecker_timeout = int(os.environ.get('AUTOTSS_TSSCHECKER_TIMEOUT', 120))
+    except ValueError:
+        tsschecker_timeout = 0
+
+    if tsschecker_timeout <= 0:
+        sys.exit(
+            "[ERROR] Invalid tsschecker timeout set in 'AUTOTSS_TSSCHECKER_TIMEOUT' environment variable. Exiting."
+        )
+
+    archive_codec = os.environ.get('AUTOTSS_ARCHIVE_CODEC', 'xz').lower()
+    if archive_codec not in CODECS.keys():
+        sys.exit(
+            f"[ERROR] Invalid archive codec set in 'AUTOTSS_ARCHIVE_CODEC' environment variable, must be one of: {', '.join(CODECS)}. Exiting."
+        )
+
+    if 'AUTOTSS_ARCHIVE_LEVEL' in os.environ.keys():
+        try:
+            archive_level = int(os.environ['AUTOTSS_ARCHIVE_LEVEL'])
+        except ValueError:
+            archive_level = None
+
+        if archive_level not in CODECS[archive_codec].levels:
+            sys.exit(
+                "[ERROR] Invalid archive compression level set in 'AUTOTSS_ARCHIVE_LEVEL' environment variable. Exiting."
+            )
+    else:
+        archive_level = None
+
+    try:
+        max_upload = int(os.environ.get('AUTOTSS_UPLOAD_LIMIT', 8))
+    except ValueError:
+        max_upload = 0
+
+    if max_upload <= 0:
+        sys.exit(
+            "[ERROR] Invalid upload limit set in 'AUTOTSS_UPLOAD_LIMIT' environment variable. Exiting."
+        )
+
+    if 'AUTOTSS_HTTP_URL' in os.environ.keys():
+        try:
+            http_port = int(os.environ.get('AUTOTSS_HTTP_PORT', 8080))
+            http_expiry = int(os.environ.get('AUTOTSS_HTTP_EXPIRY', 3600))
+        except ValueError:
+            http_port = http_expiry = 0
+
+        if not 0 < http_port < 65536:
+            sys.exit(
+                "[ERROR] Invalid port set in 'AUTOTSS_HTTP_PORT' environment variable. Exiting."
+            )
+
+        if http_expiry <= 0:
+            sys.exit(
+                "[ERROR] Invalid link expiry set in 'AUTOTSS_HTTP_EXPIRY' environment variable. Exiting."
+            )
+
+        # Every cluster has to sign links with the same key
+        http_secret = os.environ.get(
+            'AUTOTSS_HTTP_SECRET',
+            sha256(f"{os.environ['AUTOTSS_TOKEN']}:downloads".encode()).hexdigest(),
+        ).encode()
+
+        downloads = DownloadServer(
+            os.environ['AUTOTSS_HTTP_URL'],
+            http_secret,
+            os.environ.get('AUTOTSS_HTTP_HOST', '0.0.0.0'),
+            http_port,
+            http_expiry,
+        )
+    else:
+        downloads = None
+
     if 'AUTOTSS_TEST_GUILD' in os.environ.keys():
         try:
             debug_guild = int(os.environ['AUTOTSS_TEST_GUILD'])
@@ -88,7 +175,12 @@ async def startup():
     (intents := discord.Intents.default()).members = True
 
     bot = discord.AutoShardedBot(
-        help_command=None, intents=intents, allowed_mentions=mentions, owner_id=owner
+        help_command=None,
+        intents=intents,
+        allowed_mentions=mentions,
+        owner_id=owner,
+        shard_ids=shard_ids,
+        shard_count=shard_count,
     )
 
     if debug_guild is not None:
@@ -107,7 +199,12 @@ async def startup():
 
     db_path = aiopath.AsyncPath('Data/autotss.db')
     await db_path.parent.mkdir(exist_ok=True)
-    async with aiosqlite.connect(db_path) as db, aiohttp.ClientSession() as session:
+    async with aiosqlite.connect(
+        db_path, timeout=30
+    ) as db, aiohttp.ClientSession() as session:
+        # Allow cluster processes to read while another one is writing
+        await db.execute('PRAGMA journal_mode=WAL')
+
         await db.execute(
             '''
             CREATE TABLE IF NOT EXISTS autotss(
@@ -130,6 +227,120 @@ async def startup():
         )
         await db.commit()
 
+        await db.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS leases(
+            name TEXT PRIMARY KEY,
+            holder TEXT,
+            expires REAL
+            )
+            '''
+        )
+        await db.commit()
+
+        await db.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS failures(
+            ecid TEXT,
+            buildid TEXT,
+            reason TEXT,
+            attempts INTEGER,
+            retry REAL,
+            PRIMARY KEY(ecid, buildid)
+            )
+            '''
+        )
+        await db.commit()
+
+        await db.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS blobs(
+            ecid TEXT,
+            version TEXT,
+            buildid TEXT,
+            apnonce TEXT,
+            path TEXT PRIMARY KEY,
+            saved REAL,
+            sha256 TEXT,
+            pack TEXT,
+            offset INTEGER,
+            length INTEGER,
+            size INTEGER,
+            mtime REAL,
+            verified REAL
+            )
+            '''
+        )
+        await db.execute('CREATE INDEX IF NOT EXISTS blobs_ecid ON blobs(ecid)')
+        await db.commit()
+
+        # Add columns introduced after the blobs table was first created
+        async with db.execute('PRAGMA table_info(blobs)') as cursor:
+            columns = [row[1] for row in await cursor.fetchall()]
+
+        for column, column_type in {
+            'saved': 'REAL',
+            'sha256': 'TEXT',
+            'pack': 'TEXT',
+            'offset': 'INTEGER',
+            'length': 'INTEGER',
+            'size': 'INTEGER',
+            'mtime': 'REAL',
+            'verified': 'REAL',
+        }.items():
+            if column not in columns:
+                await db.execute(
+                    f'ALTER TABLE blobs ADD COLUMN {column} {column_type}'
+                )
+        await db.commit()
+
+        await db.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS downloads(
+            user INTEGER,
+            ecid TEXT,
+            downloaded REAL,
+            PRIMARY KEY(user, ecid)
+            )
+            '''
+        )
+        await db.commit()
+
+        await db.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS first_blobs(
+            ecid TEXT PRIMARY KEY,
+            added REAL,
+            saved REAL
+            )
+            '''
+        )
+        await db.commit()
+
+        await db.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS manifests(
+            identifier TEXT,
+            buildid TEXT,
+            boardconfigs JSON,
+            PRIMARY KEY(identifier, buildid)
+            )
+            '''
+        )
+        await db.commit()
+
+        await db.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS signed_firms(
+            identifier TEXT,
+            buildid TEXT,
+            since REAL,
+            PRIMARY KEY(identifier, buildid)
+            )
+            '''
+        )
+        await db.commit()
+
         async with db.execute(
             'SELECT devices from autotss WHERE enabled = ?', (True,)
         ) as cursor:
@@ -143,17 +354,47 @@ async def startup():
 
         cpu_count = min(32, (await asyncio.to_thread(os.cpu_count) or 1) + 4)
         bot.get_cog('Utilities').sem = asyncio.Semaphore(cpu_count)
+        bot.get_cog('Utilities').scheduler = JobScheduler(
+            bot.get_cog('Utilities').sem, cpu_count
+        )
+        bot.get_cog('Utilities').failures = FailureCache(db)
+        bot.get_cog('Utilities').user_locks = UserLocks(db, cluster)
+        bot.get_cog('Utilities').runs = RunCoordinator(db, cluster)
+        bot.get_cog('Utilities').manifests = ManifestIndex(db)
+        bot.get_cog('Utilities').watchdog.timeout = tsschecker_timeout
+        await bot.get_cog('Utilities').scratch.setup(cpu_count, cluster)
+        bot.get_cog('Utilities').archives.codec = archive_codec
+        bot.get_cog('Utilities').archives.level = archive_level
+        bot.get_cog('Utilities').max_upload = max_upload * 1024 * 1024
+
+        bot.get_cog('Utilities').catalog = BlobCatalog(db)
+        rebuild_lease = Lease(db, 'catalog_rebuild', cluster)
+        if (
+            await bot.get_cog('Utilities').catalog.count() == 0
+            and await rebuild_lease.acquire()
+        ):  # Index blobs saved before the catalog existed, once across clusters
+            try:
+                await bot.get_cog('Utilities').catalog.rebuild()
+            finally:
+                await rebuild_lease.release()
+        else:
+            await bot.get_cog('Utilities').catalog.date_blobs()
+
+        bot.get_cog('Utilities').downloads = downloads
+        if downloads is not None and not cluster:  # Only one cluster serves downloads
+            await downloads.start()
 
         # Setup bot attributes
+        bot.cluster = cluster
         bot.db = db
         bot.max_devices = max_devices
         bot.session = session
         bot.start_time = await asyncio.to_thread(datetime.now)
 
         if 'AUTOTSS_WEBHOOK' in os.environ.keys():
-            bot.logger = Logger(bot, os.environ['AUTOTSS_WEBHOOK']).logger
+            bot.logger = Logger(bot, os.environ['AUTOTSS_WEBHOOK'], cluster).logger
         else:
-            bot.logger = Logger().logger
+            bot.logger = Logger(cluster=cluster).logger
 
         try:
             await bot.start(os.environ['AUTOTSS_TOKEN'])
@@ -165,10 +406,79 @@ async def startup():
             sys.exit(
                 "[ERROR] Server Members Intent not enabled, go to 'https://discord.com/developers/applications' and enable the Server Members Intent. Exiting."
             )
+        finally:
+            # Don't leave orphaned tsschecker processes behind on shutdown
+            bot.get_cog('Utilities').watchdog.kill_all()
+            bot.get_cog('Utilities').archives.close()
+            bot.get_cog('Utilities').manifests.close()
+            bot.get_cog('Utilities').scheduler.stop()
+            if downloads is not None and not cluster:
+                await downloads.stop()
 
 
-if __name__ == '__main__':
+def run_cluster(
+    cluster: Optional[int] = None,
+    shard_ids: Optional[list[int]] = None,
+    shard_count: Optional[int] = None,
+) -> None:
     try:
-        asyncio.run(startup())
+        asyncio.run(startup(cluster, shard_ids, shard_count))
     except KeyboardInterrupt:
         pass
+
+
+def main() -> None:
+    load_dotenv()
+    try:
+        clusters = int(os.environ.get('AUTOTSS_CLUSTERS', 1))
+    except ValueError:
+        sys.exit(
+            "[ERROR] Invalid cluster count set in 'AUTOTSS_CLUSTERS' environment variable. Exiting."
+        )
+
+    if clusters <= 1:
+        run_cluster()
+        return
+
+    if 'AUTOTSS_TOKEN' not in os.environ.keys():
+        sys.exit(
+            "[ERROR] Bot token not set in 'AUTOTSS_TOKEN' environment variable. Exiting."
+        )
+
+    if 'AUTOTSS_SHARDS' in os.environ.keys():
+        try:
+            shard_count = int(os.environ['AUTOTSS_SHARDS'])
+        except ValueError:
+            sys.exit(
+                "[ERROR] Invalid shard count set in 'AUTOTSS_SHARDS' environment variable. Exiting."
+            )
+    else:
+        shard_count = asyncio.run(fetch_shard_count(os.environ['AUTOTSS_TOKEN']))
+        if shard_count is None:
+            sys.exit(
+                "[ERROR] Failed to fetch the recommended shard count from Discord, set it in the 'AUTOTSS_SHARDS' environment variable. Exiting."
+            )
+
+    processes = [
+        multiprocessing.Process(
+            target=run_cluster,
+            args=(cluster, shard_ids, shard_count),
+            name=f'AutoTSS Cluster {cluster}',
+        )
+        for cluster, shard_ids in enumerate(shard_ranges(shard_count, clusters))
+    ]
+
+    for process in processes:
+        process.start()
+
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+            process.join()
+
+
+if __name__ == '__main__':
+    main()
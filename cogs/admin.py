@@ -2,12 +2,16 @@ from .botutils import UtilsCog
 from discord.errors import ExtensionAlreadyLoaded, ExtensionFailed, ExtensionNotLoaded
 from discord.ext import commands
 from discord.commands import permissions, Option
+from utils.archive import CODECS
+from utils.fs import ecid_dirs, legacy_ecids, migrate_ecid_dir
+from utils.integrity import audit
+from utils.scheduler import MANUAL
 from views.buttons import PaginatorView, SelectView
 
-import aiofiles
 import aiopath
 import asyncio
 import discord
+import os
 import ujson
 import time
 
@@ -225,7 +229,17 @@ class AdminCog(commands.Cog, name='Administrator'):
         name='downloadall',
         description='Download SHSH blobs for all devices in AutoTSS.',
     )
-    async def download_all_blobs(self, ctx: discord.ApplicationContext) -> None:
+    async def download_all_blobs(
+        self,
+        ctx: discord.ApplicationContext,
+        codec: Option(
+            str,
+            description='Archive codec to use',
+            choices=list(CODECS),
+            required=False,
+        ),
+        level: Option(int, description='Compression level to use', required=False),
+    ) -> None:
         await ctx.defer(ephemeral=True)
 
         if await self.bot.is_owner(ctx.author) == False:
@@ -243,26 +257,48 @@ class AdminCog(commands.Cog, name='Administrator'):
             await ctx.respond(embed=embed)
             return
 
-        ecids = [
-            ecid.stem
-            async for ecid in aiopath.AsyncPath('Data/Blobs').glob('*')
-            if ecid.is_dir()
-        ]
-        async with aiofiles.tempfile.TemporaryDirectory() as tmpdir:
-            tar = await self.utils.backup_blobs(aiopath.AsyncPath(tmpdir), *ecids)
+        codec = codec or self.utils.archives.codec
+        levels = CODECS[codec].levels
+        if level is not None and level not in levels:
+            raise commands.BadArgument(
+                f'The compression level for `{codec}` must be between {levels.start} and {levels[-1]}.'
+            )
+
+        start_time = await asyncio.to_thread(time.time)
+        volumes = await self.utils.backup_blobs(
+            *await self.utils.catalog.ecids(),
+            codec=codec,
+            level=level,
+            volume_size=self.utils.upload_limit(ctx),
+        )
+        finish_time = await asyncio.to_thread(time.time) - start_time
 
-        if tar is None:
+        if not volumes:
             embed = discord.Embed(
                 title='Error', description='There are no SHSH blobs saved in AutoTSS.'
             )
             await ctx.respond(embed=embed)
 
         else:
+            size = (
+                sum(
+                    [
+                        (await asyncio.to_thread(os.fstat, volume.fileno())).st_size
+                        for volume in volumes
+                    ]
+                )
+                / 1048576
+            )
+            throughput = f'{size:.2f} MiB in {finish_time:.1f}s ({size / max(finish_time, 0.001):.2f} MiB/s)'
+
             embed = discord.Embed(
-                title='Download Blobs', description='Download all SHSH Blobs:'
+                title='Download Blobs',
+                description=f'Download all SHSH Blobs:\n\n*{throughput}*',
             )
-            await ctx.respond(
-                embed=embed, file=discord.File(fp=tar, filename='SHSH Blobs.tar.xz')
+            await self.utils.send_archives(ctx, embed, volumes, codec)
+
+            self.bot.logger.info(
+                f'Built {codec} archive of all SHSH blobs: {throughput}.'
             )
 
         self.bot.logger.info(f'Owner: `@{ctx.author}` has downloaded all SHSH blobs.')
@@ -290,15 +326,6 @@ class AdminCog(commands.Cog, name='Administrator'):
             await ctx.respond(embed=embed)
             return
 
-        if self.utils.saving_blobs:
-            embed = discord.Embed(
-                title='Hey!',
-                description="I'm automatically saving SHSH blobs right now, please wait until I'm finished to manually save SHSH blobs.",
-            )
-            await ctx.respond(embed=embed)
-            return
-
-        self.utils.saving_blobs = True
         await self.bot.change_presence(
             activity=discord.Game(name='Currently saving SHSH blobs!')
         )
@@ -314,19 +341,28 @@ class AdminCog(commands.Cog, name='Administrator'):
         await ctx.respond(embed=embed)
 
         start_time = await asyncio.to_thread(time.time)
-        data = await asyncio.gather(
-            *[
-                self.utils.sem_call(
-                    self.utils.save_user_blobs, user_data[0], ujson.loads(user_data[1])
-                )
+
+        # Each identifier's firmwares are fetched once, not once per user
+        identifiers = list(
+            {
+                device['identifier']
                 for user_data in data
-            ]
+                for device in ujson.loads(user_data[1])
+            }
         )
+        firms = dict(
+            zip(
+                identifiers,
+                await asyncio.gather(
+                    *[self.utils.sem_call(self.utils.get_firms, i) for i in identifiers]
+                ),
+            )
+        )
+        stats = await self.utils.save_all_blobs(firms, {}, {}, default=MANUAL)
         finish_time = round(await asyncio.to_thread(time.time) - start_time)
-        self.utils.saving_blobs = False
 
-        blobs_saved = sum(user['blobs_saved'] for user in data)
-        devices_saved = sum(user['devices_saved'] for user in data)
+        blobs_saved = stats['blobs_saved']
+        devices_saved = stats['devices_saved']
 
         if blobs_saved > 0:
             embed.description = ' '.join(
@@ -347,6 +383,321 @@ class AdminCog(commands.Cog, name='Administrator'):
         await self.utils.update_device_count()
         await ctx.edit(embed=embed)
 
+    @admin.command(
+        name='rebuildcatalog',
+        description='Reconcile the SHSH blob catalog with the files on disk.',
+    )
+    async def rebuild_catalog(self, ctx: discord.ApplicationContext) -> None:
+        await ctx.defer(ephemeral=True)
+
+        if await self.bot.is_owner(ctx.author) == False:
+            raise commands.NotOwner()
+
+        start_time = await asyncio.to_thread(time.time)
+        added, removed = await self.utils.catalog.rebuild()
+        finish_time = round(await asyncio.to_thread(time.time) - start_time)
+
+        embed = discord.Embed(
+            title='Rebuild Catalog',
+            description=' '.join(
+                (
+                    f"Added **{added} SHSH blob{'s' if added != 1 else ''}**",
+                    f"and removed **{removed} missing SHSH blob{'s' if removed != 1 else ''}**",
+                    f"in **{finish_time} second{'s' if finish_time != 1 else ''}**.",
+                )
+            ),
+        )
+        embed.set_footer(
+            text=ctx.author.display_name,
+            icon_url=ctx.author.display_avatar.with_static_format('png').url,
+        )
+        await ctx.respond(embed=embed)
+
+        self.bot.logger.info(
+            f'Owner: `@{ctx.author}` has rebuilt the SHSH blob catalog ({added} added, {removed} removed).'
+        )
+
+    @admin.command(
+        name='dedupe',
+        description='Deduplicate saved SHSH blobs and clean up unused stored objects.',
+    )
+    async def dedupe_blobs(self, ctx: discord.ApplicationContext) -> None:
+        await ctx.defer(ephemeral=True)
+
+        if await self.bot.is_owner(ctx.author) == False:
+            raise commands.NotOwner()
+
+        start_time = await asyncio.to_thread(time.time)
+        paths = await self.utils.catalog.unhashed()
+        await self.utils.catalog.set_records(
+            paths, await self.utils.objects.ingest(paths)
+        )
+        stats = await self.utils.objects.collect()
+        finish_time = round(await asyncio.to_thread(time.time) - start_time)
+
+        saved = (stats.linked_bytes - stats.stored_bytes) / 1048576
+        embed = discord.Embed(
+            title='Deduplicate Blobs',
+            description=' '.join(
+                (
+                    f"Hashed **{len(paths)} SHSH blob{'s' if len(paths) != 1 else ''}**",
+                    f"and removed **{stats.orphans} unused object{'s' if stats.orphans != 1 else ''}**",
+                    f"in **{finish_time} second{'s' if finish_time != 1 else ''}**.",
+                )
+            ),
+        )
+        embed.add_field(name='Stored Objects', value=stats.objects)
+        embed.add_field(name='SHSH Blob Files', value=stats.links)
+        embed.add_field(name='Space Saved', value=f'{saved:.2f} MiB')
+        embed.set_footer(
+            text=ctx.author.display_name,
+            icon_url=ctx.author.display_avatar.with_static_format('png').url,
+        )
+        await ctx.respond(embed=embed)
+
+        self.bot.logger.info(
+            f'Owner: `@{ctx.author}` has deduplicated SHSH blobs ({stats.links} files stored as {stats.objects} objects, {saved:.2f} MiB saved).'
+        )
+
+    @admin.command(
+        name='compact',
+        description='Pack SHSH blobs for unsigned firmwares into one file per device.',
+    )
+    async def compact_blobs(
+        self,
+        ctx: discord.ApplicationContext,
+        days: Option(
+            int,
+            description='Only pack SHSH blobs saved at least this many days ago',
+            default=30,
+        ),
+    ) -> None:
+        await ctx.defer(ephemeral=True)
+
+        if await self.bot.is_owner(ctx.author) == False:
+            raise commands.NotOwner()
+
+        async with self.bot.db.execute('SELECT devices from autotss') as cursor:
+            devices = [
+                device
+                for user_devices in await cursor.fetchall()
+                for device in ujson.loads(user_devices[0])
+            ]
+
+        start_time = await asyncio.to_thread(time.time)
+        before = start_time - days * 86400
+        packed = await asyncio.gather(
+            *[
+                self.utils.sem_call(self.utils.pack_device_blobs, device, before)
+                for device in devices
+            ]
+        )
+        finish_time = round(await asyncio.to_thread(time.time) - start_time)
+
+        num_blobs = sum(packed)
+        num_devices = len([num for num in packed if num > 0])
+        embed = discord.Embed(
+            title='Compact Blobs',
+            description=' '.join(
+                (
+                    f"Packed **{num_blobs} SHSH blob{'s' if num_blobs != 1 else ''}**",
+                    f"for **{num_devices} device{'s' if num_devices != 1 else ''}**",
+                    f"in **{finish_time} second{'s' if finish_time != 1 else ''}**.",
+                )
+            ),
+        )
+        embed.set_footer(
+            text=ctx.author.display_name,
+            icon_url=ctx.author.display_avatar.with_static_format('png').url,
+        )
+        await ctx.respond(embed=embed)
+
+        self.bot.logger.info(
+            f'Owner: `@{ctx.author}` has packed {num_blobs} SHSH blobs for {num_devices} devices.'
+        )
+
+    @admin.command(
+        name='migratelayout',
+        description='Move saved SHSH blobs into the fan-out directory layout.',
+    )
+    async def migrate_layout(self, ctx: discord.ApplicationContext) -> None:
+        await ctx.defer(ephemeral=True)
+
+        if await self.bot.is_owner(ctx.author) == False:
+            raise commands.NotOwner()
+
+        start_time = await asyncio.to_thread(time.time)
+        migrated = 0
+        for ecid in await legacy_ecids('Data/Blobs'):
+            # Saves for this ECID wait here before moving their blobs into place
+            async with self.utils.user_locks.hold(*await self.utils.ecid_owners(ecid)):
+                if not await migrate_ecid_dir('Data/Blobs', ecid):
+                    continue
+
+                fanout, legacy = ecid_dirs('Data/Blobs', ecid)
+                await self.utils.catalog.move_prefix(ecid, f'{legacy}/', f'{fanout}/')
+                await self.utils.archives.invalidate(ecid)
+
+            migrated += 1
+
+        finish_time = round(await asyncio.to_thread(time.time) - start_time)
+
+        embed = discord.Embed(
+            title='Migrate Layout',
+            description=' '.join(
+                (
+                    f"Migrated SHSH blobs for **{migrated} ECID{'s' if migrated != 1 else ''}**",
+                    f"in **{finish_time} second{'s' if finish_time != 1 else ''}**.",
+                )
+            ),
+        )
+        embed.set_footer(
+            text=ctx.author.display_name,
+            icon_url=ctx.author.display_avatar.with_static_format('png').url,
+        )
+        await ctx.respond(embed=embed)
+
+        self.bot.logger.info(
+            f'Owner: `@{ctx.author}` has migrated SHSH blobs for {migrated} ECIDs to the fan-out layout.'
+        )
+
+    @admin.command(
+        name='audit', description='Verify the checksums of all saved SHSH blobs.'
+    )
+    async def audit_blobs(
+        self,
+        ctx: discord.ApplicationContext,
+        full: Option(
+            bool,
+            description='Re-hash SHSH blobs that have not changed since the last audit',
+            default=False,
+        ),
+    ) -> None:
+        await ctx.defer(ephemeral=True)
+
+        if await self.bot.is_owner(ctx.author) == False:
+            raise commands.NotOwner()
+
+        start_time = await asyncio.to_thread(time.time)
+        result = await audit(
+            await self.utils.catalog.audit_rows(), self.utils.archives.workers, full
+        )
+        await self.utils.catalog.set_verified(result.verified, start_time)
+        finish_time = await asyncio.to_thread(time.time) - start_time
+
+        size = result.hashed_bytes / 1048576
+        throughput = f'{size:.2f} MiB in {finish_time:.1f}s ({size / max(finish_time, 0.001):.2f} MiB/s)'
+
+        embed = discord.Embed(
+            title='Audit Blobs',
+            description=' '.join(
+                (
+                    f"Verified **{result.checked} SHSH blob{'s' if result.checked != 1 else ''}**",
+                    f"and skipped **{result.skipped} unchanged SHSH blob{'s' if result.skipped != 1 else ''}**.",
+                )
+            )
+            + f'\n\n*{throughput}*',
+        )
+        embed.add_field(name='Mismatched', value=len(result.mismatched))
+        embed.add_field(name='Missing', value=len(result.missing))
+        if result.mismatched:
+            embed.add_field(
+                name='Mismatched SHSH Blobs',
+                value='\n'.join(f'`{path}`' for path in result.mismatched[:10])
+                + (
+                    f'\n*...and {len(result.mismatched) - 10} more*'
+                    if len(result.mismatched) > 10
+                    else ''
+                ),
+                inline=False,
+            )
+
+        embed.set_footer(
+            text=ctx.author.display_name,
+            icon_url=ctx.author.display_avatar.with_static_format('png').url,
+        )
+        await ctx.respond(embed=embed)
+
+        self.bot.logger.info(
+            f'Owner: `@{ctx.author}` has audited SHSH blobs ({result.checked} verified, {len(result.mismatched)} mismatched, {len(result.missing)} missing, {throughput}).'
+        )
+
+    @admin.command(
+        name='reconcile',
+        description='Find orphaned SHSH blobs and saved SHSH blob drift for devices.',
+    )
+    async def reconcile_blobs(
+        self,
+        ctx: discord.ApplicationContext,
+        clean: Option(
+            bool,
+            description='Delete SHSH blobs that belong to no device',
+            default=False,
+        ),
+        repair: Option(
+            bool,
+            description="Update devices' saved SHSH blobs to match the files on disk",
+            default=False,
+        ),
+    ) -> None:
+        await ctx.defer(ephemeral=True)
+
+        if await self.bot.is_owner(ctx.author) == False:
+            raise commands.NotOwner()
+
+        if (clean or repair) and await self.utils.runs.running():
+            embed = discord.Embed(
+                title='Hey!',
+                description="I'm currently automatically saving SHSH blobs, please wait until I'm finished to reconcile SHSH blobs.",
+            )
+            await ctx.respond(embed=embed)
+            return
+
+        start_time = await asyncio.to_thread(time.time)
+        result = await self.utils.reconcile_blobs()
+
+        if clean:
+            for ecid in result.orphans:
+                await self.utils.purge_blobs(ecid)
+
+        if repair:
+            users = {}
+            for drift in result.drift:
+                users.setdefault(drift.user, []).append(drift)
+
+            for user, drift in users.items():
+                await self.utils.repair_drift(user, drift)
+
+        finish_time = round(await asyncio.to_thread(time.time) - start_time)
+
+        missing = sum(len(drift.missing) for drift in result.drift)
+        untracked = sum(len(drift.untracked) for drift in result.drift)
+        embed = discord.Embed(
+            title='Reconcile Blobs',
+            description=f"Reconciled SHSH blobs in **{finish_time} second{'s' if finish_time != 1 else ''}**.",
+        )
+        embed.add_field(
+            name=f"Orphaned ECIDs{' (Deleted)' if clean else ''}",
+            value=len(result.orphans),
+        )
+        embed.add_field(
+            name=f"Missing SHSH Blobs{' (Repaired)' if repair else ''}",
+            value=missing,
+        )
+        embed.add_field(
+            name=f"Untracked SHSH Blobs{' (Repaired)' if repair else ''}",
+            value=untracked,
+        )
+        embed.set_footer(
+            text=ctx.author.display_name,
+            icon_url=ctx.author.display_avatar.with_static_format('png').url,
+        )
+        await ctx.respond(embed=embed)
+
+        self.bot.logger.info(
+            f'Owner: `@{ctx.author}` has reconciled SHSH blobs ({len(result.orphans)} orphaned ECIDs, {missing} missing, {untracked} untracked).'
+        )
+
     @admin.command(
         name='dtransfer', description="Transfer a user's devices to another user."
     )
@@ -378,13 +729,6 @@ class AdminCog(commands.Cog, name='Administrator'):
 
         await ctx.defer()
 
-        if (
-            self.utils.saving_blobs == True
-        ):  # Avoid any potential conflict with transferring devices while blobs are being saved
-            invalid_embed.description = "I'm currently automatically saving SHSH blobs, please wait until I'm finished to transfer devices."
-            await ctx.respond(embed=invalid_embed)
-            return
-
         if old == new:
             invalid_embed.description = (
                 "Silly goose, you can't transfer devices between the same user!"
@@ -450,10 +794,25 @@ class AdminCog(commands.Cog, name='Administrator'):
             await ctx.edit(embed=cancelled_embed)
             return
 
-        await self.bot.db.execute(
-            'UPDATE autotss SET user = ? WHERE user = ?', (new.id, old.id)
-        )
-        await self.bot.db.commit()
+        async with self.utils.user_locks.hold(old.id, new.id):
+            # Either user may have added devices while waiting for confirmation
+            async with self.bot.db.execute(
+                'SELECT devices from autotss WHERE user = ?', (new.id,)
+            ) as cursor:
+                row = await cursor.fetchone()
+
+            if row is not None and ujson.loads(row[0]):
+                invalid_embed.description = (
+                    f'{new.mention} has devices added to AutoTSS already.'
+                )
+                await ctx.edit(embed=invalid_embed)
+                return
+
+            await self.bot.db.execute('DELETE FROM autotss WHERE user = ?', (new.id,))
+            await self.bot.db.execute(
+                'UPDATE autotss SET user = ? WHERE user = ?', (new.id, old.id)
+            )
+            await self.bot.db.commit()
 
         embed.description = f"Successfully transferred {old.mention}'s **{len(old_devices)} device{'s' if len(old_devices) != 1 else ''}** to {new.mention}."
         await ctx.edit(embed=embed)
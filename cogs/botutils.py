@@ -1,32 +1,66 @@
 from datetime import datetime
-from io import BytesIO
 from discord.enums import SlashCommandOptionType
 from discord.ext import commands
 from hashlib import sha1, sha384
+from utils.archive import ArchiveCache, archive_name
 from utils.errors import *
-from typing import Optional, Union
+from utils.failures import classify_failure
+from utils.fs import (
+    ecid_builds,
+    ecid_dirs,
+    ecid_paths,
+    move_files,
+    remove_files,
+    resolve_ecid_dir,
+    scan_dir,
+)
+from utils.objects import ObjectStore
+from utils.packs import PackStore
+from utils.reconcile import Reconciliation, reconcile
+from utils.process import ProcessWatchdog
+from utils.scratch import ScratchPool
+from utils.scheduler import MANUAL, ROUTINE, SaveProgress, run_jobs
+from views.buttons import SelectView
+from typing import AsyncIterator, BinaryIO, Optional, Union
 
-import aiofiles
 import aiopath
 import asyncio
 import discord
-import glob
 import ujson
+import os
 import pathlib
 import remotezip
 import shutil
 import sys
-import tarfile
+import time
 
 
 API_URL = 'https://api.ipsw.me/v4'
 BETA_API_URL = 'https://api.m1sta.xyz/betas'
+DEVICE_API_TTL = 300  # Seconds a device's ipsw.me data is reused for validation
 
 
 class UtilsCog(commands.Cog, name='Utilities'):
     def __init__(self, bot: discord.Bot):
         self.bot = bot
-        self.saving_blobs = False
+        self.watchdog = ProcessWatchdog()
+        self.scratch = ScratchPool()
+        self.archives = ArchiveCache()
+        self.objects = ObjectStore()
+        self.packs = PackStore()
+        self.max_upload = 8 * 1024 * 1024
+        self.downloads = None
+        self.manifests = None
+        self._manifest_fetches: dict[str, asyncio.Task] = {}
+        self._queued_saves: dict[int, tuple[asyncio.Task, SaveProgress]] = {}
+        self._device_saves: set[asyncio.Task] = set()
+        self._device_apis: dict[str, tuple[float, asyncio.Task]] = {}
+
+    def cog_unload(self) -> None:
+        self.watchdog.kill_all()
+        self.archives.close()
+        if self.manifests is not None:
+            self.manifests.close()
 
     READABLE_INPUT_TYPES = {
         discord.TextChannel: 'channel',
@@ -45,15 +79,29 @@ class UtilsCog(commands.Cog, name='Utilities'):
         apnonce_len = 64 if 0x8010 <= cpid < 0x8900 else 40
         return len(nonce) == apnonce_len
 
-    async def check_boardconfig(self, identifier: str, boardconfig: str) -> bool:
+    async def check_boardconfig(
+        self, identifier: str, boardconfig: str, api: Optional[dict] = None
+    ) -> bool:
         if boardconfig[-2:] != 'ap':
             return False
 
-        api = await self.fetch_ipswme_api(identifier)
+        if api is None:
+            api = await self.fetch_ipswme_api(identifier)
+
         return any(
             (x['boardconfig'].lower() == boardconfig for x in api['boards'])
         )
 
+    async def ecid_owners(self, ecid: str) -> list[int]:
+        async with self.bot.db.execute(
+            "SELECT DISTINCT user FROM autotss, json_each(autotss.devices) WHERE json_extract(json_each.value, '$.ecid') = ?",
+            (ecid,),
+        ) as cursor:
+            return [row[0] for row in await cursor.fetchall()]
+
+    async def has_device(self, ecid: str) -> bool:
+        return len(await self.ecid_owners(ecid)) > 0
+
     async def check_ecid(self, ecid: str) -> int:
         if (
             ecid == 'abcdef0123456789'
@@ -94,12 +142,6 @@ class UtilsCog(commands.Cog, name='Utilities'):
 
         return True
 
-    async def check_identifier(self, identifier: str) -> bool:
-        async with self.bot.session.get(f'{API_URL}/devices') as resp:
-            api = await resp.json()
-
-        return identifier in [device['identifier'] for device in api]
-
     async def check_name(self, name: str, user: int) -> int:
         if len(name) > 20:  # Length check
             return -1
@@ -127,8 +169,12 @@ class UtilsCog(commands.Cog, name='Utilities'):
     def censor_ecid(self, ecid: str) -> str:
         return ('*' * len(ecid))[:-4] + ecid[-4:]
 
-    async def get_cpid(self, identifier: str, boardconfig: str) -> str:
-        api = await self.fetch_ipswme_api(identifier)
+    async def get_cpid(
+        self, identifier: str, boardconfig: str, api: Optional[dict] = None
+    ) -> str:
+        if api is None:
+            api = await self.fetch_ipswme_api(identifier)
+
         return next(
             board['cpid']
             for board in api['boards']
@@ -149,10 +195,9 @@ class UtilsCog(commands.Cog, name='Utilities'):
             '-h',
         )
 
-        cmd = await asyncio.create_subprocess_exec(
-            *args, stdout=asyncio.subprocess.PIPE
-        )
-        stdout = (await cmd.communicate())[0]
+        stdout = await self.watchdog.run(*args, timeout=10)
+        if stdout is None:
+            return 'Unknown'
 
         return stdout.decode().splitlines()[0].split(': ')[-1]
 
@@ -184,25 +229,8 @@ class UtilsCog(commands.Cog, name='Utilities'):
             scopes=('bot', 'applications.commands'),
         )
 
-    def shsh_count(self, ecid: str = None) -> int:
-        return (
-            len(
-                list(
-                    glob.glob(
-                        str(pathlib.Path(f'Data/Blobs/{ecid}/**/*.shsh*')),
-                        recursive=True,
-                    )
-                )
-            )
-            if ecid
-            else len(
-                list(
-                    glob.glob(
-                        str(pathlib.Path('Data/Blobs/**/*.shsh*')), recursive=True
-                    )
-                )
-            )
-        )
+    async def shsh_count(self, ecid: str = None) -> int:
+        return await self.catalog.count(ecid)
 
     async def update_device_count(self) -> None:
         async with self.bot.db.execute(
@@ -373,43 +401,87 @@ class UtilsCog(commands.Cog, name='Utilities'):
         return discord.Embed.from_dict(embed)
 
     # SHSH Blob functions
-    async def _get_manifest(
-        self, url: str, path: str
-    ) -> Union[bool, aiopath.AsyncPath]:
+    async def _get_manifest(self, url: str) -> Union[bool, bytes]:
         async with self.bot.session.get(
             f"{'/'.join(url.split('/')[:-1])}/BuildManifest.plist"
         ) as resp:
             if resp.status == 200:
-                manifest = await resp.read()
+                return await resp.read()
             else:
                 return False
 
-        manifest_path = pathlib.Path(path) / 'manifest.plist'
-        with manifest_path.open('wb') as f:
-            f.write(manifest)
-
-        return aiopath.AsyncPath(manifest_path)
-
-    def _sync_get_manifest(self, url: str, path: str) -> Union[bool, aiopath.AsyncPath]:
+    def _sync_get_manifest(self, url: str) -> Union[bool, bytes]:
         try:
             with remotezip.RemoteZip(url) as ipsw:
-                manifest = ipsw.read(
+                return ipsw.read(
                     next(f for f in ipsw.namelist() if 'BuildManifest' in f)
                 )
         except (remotezip.RemoteIOError, StopIteration):
             return False
 
-        manifest_path = pathlib.Path(path) / 'manifest.plist'
-        with manifest_path.open('wb') as f:
+    def _manifest_path(self, url: str) -> pathlib.Path:
+        return (
+            pathlib.Path('Data/Manifests') / f'{sha1(url.encode()).hexdigest()}.plist'
+        )
+
+    def _write_manifest(self, path: pathlib.Path, manifest: bytes) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+        with tmp_path.open('wb') as f:
             f.write(manifest)
 
-        return aiopath.AsyncPath(manifest_path)
+        tmp_path.replace(path)  # Concurrent readers never see a partial manifest
+
+    async def _fetch_manifest(self, url: str, path: pathlib.Path) -> Union[bool, str]:
+        manifest = await self._get_manifest(url) or await asyncio.to_thread(
+            self._sync_get_manifest, url
+        )
+        if manifest == False:
+            return False
+
+        await asyncio.to_thread(self._write_manifest, path, manifest)
+        return str(path)
+
+    async def fetch_manifest(self, url: str) -> Union[bool, str]:
+        path = self._manifest_path(url)
+        if await asyncio.to_thread(path.is_file):
+            return str(path)
+
+        # Saves and prefetches for the same firmware share a single download
+        if url not in self._manifest_fetches:
+            self._manifest_fetches[url] = asyncio.create_task(
+                self._fetch_manifest(url, path)
+            )
+            self._manifest_fetches[url].add_done_callback(
+                lambda _: self._manifest_fetches.pop(url, None)
+            )
+
+        return await asyncio.shield(self._manifest_fetches[url])
+
+    async def prefetch_manifest(self, identifier: str, firm: dict) -> None:
+        manifest = await self.fetch_manifest(firm['url'])
+        if manifest and await self.manifests.get(identifier, firm['buildid']) is None:
+            await self.manifests.add(identifier, firm['buildid'], manifest)
+
+    def _prune_manifests(self, urls: list[str]) -> None:
+        keep = {self._manifest_path(url).name for url in urls}
+        for path in pathlib.Path('Data/Manifests').glob('*.plist'):
+            if path.name not in keep:
+                path.unlink(missing_ok=True)
+
+    async def prune_manifests(self, urls: list[str]) -> None:
+        await asyncio.to_thread(self._prune_manifests, urls)
 
     async def _save_blob(
-        self, device: dict, firm: dict, manifest: str, tmpdir: aiopath.AsyncPath
-    ) -> bool:
+        self,
+        user: int,
+        device: dict,
+        firm: dict,
+        manifest: str,
+        tmpdir: aiopath.AsyncPath,
+    ) -> Union[bool, str, None]:
         generators = []
-        save_path = ['Data', 'Blobs', device['ecid'], firm['version'], firm['buildid']]
+        subdirs = [firm['version'], firm['buildid']]
 
         args = [
             'tsschecker'
@@ -438,92 +510,273 @@ class UtilsCog(commands.Cog, name='Utilities'):
         if device['apnonce'] is not None:
             args.append('--apnonce')
             args.append(device['apnonce'])
-            save_path.append(device['apnonce'])
+            subdirs.append(device['apnonce'])
         else:
             generators.extend(('0x1111111111111111', '0xbd34a880be0b53f3'))
-            save_path.append('no-apnonce')
+            subdirs.append('no-apnonce')
 
         if device['generator'] is not None and device['generator'] not in generators:
             generators.append(device['generator'])
 
-        save_path = aiopath.AsyncPath('/'.join(save_path))
+        # Catalog paths always use '/', like the blob walker, even on Windows
+        ecid_dir = await resolve_ecid_dir('Data/Blobs', device['ecid'])
+        save_path = '/'.join((ecid_dir, *subdirs))
+        blobs = (await scan_dir(save_path, '*.shsh*')).files
         if not generators:
-            if len([blob async for blob in save_path.glob('*.shsh*')]) == 1:
+            if len(blobs) == 1:
                 return True
 
-            cmd = await asyncio.create_subprocess_exec(
-                *args, stdout=asyncio.subprocess.PIPE
-            )
-            stdout = (await cmd.communicate())[0]
+            stdout = await self.watchdog.run(*args)
+            if stdout is None:
+                return 'timeout'
 
             if 'Saved shsh blobs!' not in stdout.decode():
-                return False
+                return classify_failure(stdout.decode())
 
         else:
-            if len([blob async for blob in save_path.glob('*.shsh*')]) == len(
-                generators
-            ):
+            if len(blobs) == len(generators):
                 return True
 
-            elif len([blob async for blob in save_path.glob('*.shsh*')]) > 0:
-                async for blob in save_path.glob('*.shsh*'):
-                    await blob.unlink()
+            elif len(blobs) > 0:
+                await remove_files(save_path, blobs)
+                await self.catalog.remove_paths(
+                    [f'{save_path}/{blob}' for blob in blobs]
+                )
 
             args.append('-g')
             for gen in generators:
                 args.append(gen)
-                cmd = await asyncio.create_subprocess_exec(
-                    *args, stdout=asyncio.subprocess.PIPE
-                )
-                stdout = (await cmd.communicate())[0]
+                stdout = await self.watchdog.run(*args)
+                if stdout is None:
+                    return 'timeout'
 
                 if 'Saved shsh blobs!' not in stdout.decode():
-                    return False
+                    return classify_failure(stdout.decode())
 
                 args.pop(-1)
 
-        await save_path.mkdir(parents=True, exist_ok=True)
-        async for blob in tmpdir.glob('*.shsh*'):
-            await blob.rename(save_path / blob.name)
+        async with self.user_locks.hold(user):
+            if not await self.has_device(device['ecid']):  # Removed while saving
+                return None
+
+            # The layout migration may have moved the ECID while tsschecker was running
+            ecid_dir = await resolve_ecid_dir('Data/Blobs', device['ecid'])
+            save_path = '/'.join((ecid_dir, *subdirs))
+            blobs = [
+                f'{save_path}/{blob}'
+                for blob in await move_files(tmpdir, save_path, '*.shsh*')
+            ]
+            await self.catalog.add(
+                device['ecid'],
+                firm['version'],
+                firm['buildid'],
+                device['apnonce'],
+                blobs,
+                await self.objects.ingest(blobs),
+            )
+            await self.archives.invalidate(device['ecid'])
 
         return True
 
-    def _create_tar(self, tmpdir: aiopath.AsyncPath) -> aiopath.AsyncPath:
-        with tarfile.open(tmpdir.parent / 'Blobs.tar.xz', 'w:xz') as tar:
-            tar.add(tmpdir, arcname=tmpdir.name)
-
     async def backup_blobs(
-        self, tmpdir: aiopath.AsyncPath, *ecids: list[str]
-    ) -> Optional[BytesIO]:
-        blobdir = aiopath.AsyncPath('Data/Blobs')
-        tmpdir = tmpdir / 'SHSH Blobs'
-        await tmpdir.mkdir()
+        self,
+        *ecids: str,
+        codec: str = None,
+        level: int = None,
+        volume_size: int = None,
+        since_user: int = None,
+    ) -> list[BinaryIO]:
+        return await self.archives.build(
+            await self.catalog.entries(*ecids, since_user=since_user),
+            codec,
+            level,
+            volume_size,
+        )
 
-        if len(ecids) == 1:
-            async for firm in blobdir.glob(f'{ecids[0]}/*'):
-                await asyncio.to_thread(shutil.copytree, firm, tmpdir / firm.name)
+    async def purge_blobs(self, ecid: str) -> None:
+        for ecid_dir in ecid_dirs('Data/Blobs', ecid):
+            await asyncio.to_thread(shutil.rmtree, ecid_dir, ignore_errors=True)
 
-        else:
-            for ecid in ecids:
-                try:
-                    await asyncio.to_thread(
-                        shutil.copytree, blobdir / ecid, tmpdir / ecid
+        await self.packs.remove(ecid)
+        await self.catalog.remove(ecid)
+        await self.archives.invalidate(ecid)
+        await self.failures.clear(ecid)
+
+    async def _saved_builds(self) -> AsyncIterator[tuple[str, int, dict]]:
+        async with self.bot.db.execute(
+            "SELECT json_extract(value, '$.ecid') AS ecid, user, json_extract(value, '$.saved_blobs') FROM autotss, json_each(autotss.devices) ORDER BY ecid"
+        ) as cursor:
+            async for ecid, user, saved_blobs in cursor:
+                yield ecid, user, {
+                    firm['buildid']: firm['version']
+                    for firm in ujson.loads(saved_blobs)
+                }
+
+    async def _present_builds(self, ecid: str) -> dict[str, str]:
+        present = await self.catalog.packed_builds(ecid)
+        for version, buildid in await ecid_builds('Data/Blobs', ecid):
+            present.setdefault(buildid, version)
+
+        return present
+
+    async def reconcile_blobs(self) -> Reconciliation:
+        # Only ECID names are listed up front, each ECID's builds are scanned as it's joined
+        disk = sorted(
+            {ecid for ecid, _ in await ecid_paths('Data/Blobs')}
+            | set(await self.packs.ecids())
+        )
+
+        return await reconcile(self._saved_builds(), disk, self._present_builds)
+
+    async def repair_drift(self, user: int, drift: list) -> None:
+        async with self.user_locks.hold(user):
+            async with self.bot.db.execute(
+                'SELECT devices from autotss WHERE user = ?', (user,)
+            ) as cursor:
+                row = await cursor.fetchone()
+
+            if row is None:
+                return
+
+            devices = ujson.loads(row[0])
+            for device_drift in drift:
+                for device in devices:
+                    if device['ecid'] != device_drift.ecid:
+                        continue
+
+                    # Forget SHSH blobs that are gone so they're saved again while signed
+                    saved = [
+                        firm
+                        for firm in device['saved_blobs']
+                        if firm['buildid'] not in device_drift.missing
+                    ]
+                    saved.extend(
+                        {'version': version, 'buildid': buildid}
+                        for version, buildid in device_drift.untracked
                     )
-                except FileNotFoundError:
-                    pass
+                    device['saved_blobs'] = saved
 
-        if not [blob async for blob in tmpdir.glob('*/') if await blob.is_dir()]:
+            await self.bot.db.execute(
+                'UPDATE autotss SET devices = ? WHERE user = ?',
+                (ujson.dumps(devices), user),
+            )
+            await self.bot.db.commit()
+
+    async def pack_device_blobs(self, device: dict, before: float) -> int:
+        blobs = await self.catalog.unpacked(device['ecid'], before)
+        if not blobs:
+            return 0
+
+        # Only firmwares that can no longer be saved are packed
+        signed = {
+            firm['buildid']
+            for firm in await self.get_firms(device['identifier'])
+            if firm['signed'] == True
+        }
+        blobs = [blob for blob in blobs if blob[0] not in signed]
+        if not blobs:
+            return 0
+
+        paths = [blob[1] for blob in blobs]
+        locations = await self.packs.append(
+            device['ecid'],
+            [blob[1:] for blob in blobs],
+            await self.catalog.pack_index(device['ecid']),
+        )
+        await self.catalog.set_packed(
+            self.packs.pack_path(device['ecid']), paths, locations
+        )
+        await self.packs.discard(
+            [path for path, location in zip(paths, locations) if location is not None]
+        )
+
+        return len([location for location in locations if location is not None])
+
+    def upload_limit(self, ctx: discord.ApplicationContext) -> Optional[int]:
+        if self.downloads is not None:  # Linked downloads aren't capped
+            return None
+
+        if ctx.guild is not None:
+            return min(self.max_upload, ctx.guild.filesize_limit)
+
+        return self.max_upload
+
+    async def send_archives(
+        self,
+        ctx: discord.ApplicationContext,
+        embed: discord.Embed,
+        volumes: list[BinaryIO],
+        codec: str = None,
+    ) -> None:
+        codec = codec or self.archives.codec
+        if self.downloads is not None:
+            urls = await self.downloads.publish(
+                [
+                    (archive_name(codec, num, len(volumes)), volume)
+                    for num, volume in enumerate(volumes, start=1)
+                ]
+            )
+
+            buttons = [
+                {
+                    'label': 'Download' if len(urls) == 1 else f'Part {num}',
+                    'style': discord.ButtonStyle.link,
+                    'url': url,
+                }
+                for num, url in enumerate(urls, start=1)
+            ]
+
+            embed.description += f'\n\n*Link{"s" if len(urls) > 1 else ""} expire <t:{int(time.time()) + self.downloads.expiry}:R>.*'
+            await ctx.edit(embed=embed, view=SelectView(buttons, ctx, timeout=None))
             return
 
-        await asyncio.to_thread(self._create_tar, tmpdir)
-        return BytesIO(await (tmpdir.parent / 'Blobs.tar.xz').read_bytes())
+        if len(volumes) > 1:
+            embed.description += f'\n\n*Split into {len(volumes)} archives to fit the upload limit, each one can be extracted on its own.*'
+
+        for num, volume in enumerate(volumes, start=1):
+            file = discord.File(
+                fp=volume, filename=archive_name(codec, num, len(volumes))
+            )
+            if num == 1:
+                await ctx.edit(embed=embed, file=file)
+            else:
+                await ctx.respond(file=file, ephemeral=True)
 
-    async def fetch_ipswme_api(self, identifier: str) -> dict:
+    async def _fetch_ipswme_api(self, identifier: str) -> Optional[dict]:
         async with self.bot.session.get(f'{API_URL}/device/{identifier}') as resp:
+            if resp.status != 200:  # Unknown identifier
+                return None
+
             return await resp.json()
 
+    async def fetch_ipswme_api(
+        self, identifier: str, fresh: bool = False
+    ) -> Optional[dict]:
+        # Checks for the same device share one request, signing status is always refetched
+        now = time.monotonic()
+        cached = self._device_apis.get(identifier)
+        if fresh or cached is None or cached[0] <= now:
+            task = asyncio.create_task(self._fetch_ipswme_api(identifier))
+            self._device_apis[identifier] = (now + DEVICE_API_TTL, task)
+        else:
+            task = cached[1]
+
+        api = None
+        try:
+            api = await asyncio.shield(task)
+        finally:
+            # Don't keep failed lookups around, they may just be a bad response
+            if (
+                api is None
+                and task.done()
+                and self._device_apis.get(identifier, (0, None))[1] is task
+            ):
+                del self._device_apis[identifier]
+
+        return api
+
     async def get_firms(self, identifier: str) -> list:
-        api = await self.fetch_ipswme_api(identifier)
+        api = await self.fetch_ipswme_api(identifier, fresh=True)
 
         buildids = [
             {
@@ -559,10 +812,14 @@ class UtilsCog(commands.Cog, name='Utilities'):
 
         return buildids
 
-    async def save_device_blobs(self, device: dict) -> None:
-        stats = {'saved_blobs': [], 'failed_blobs': []}
+    async def pending_firms(
+        self, device: dict, firms: list[dict]
+    ) -> tuple[list[dict], list[dict], dict]:
+        pending = []
+        skipped = []
 
-        firms = await self.get_firms(device['identifier'])
+        retries = await self.failures.get_retries(device['ecid'])
+        now = await asyncio.to_thread(time.time)
         for firm in [f for f in firms if f['signed'] == True]:
             if any(
                 firm['buildid'] == saved_firm['buildid']
@@ -570,51 +827,295 @@ class UtilsCog(commands.Cog, name='Utilities'):
             ):  # If we've already saved blobs for this version, skip
                 continue
 
-            async with aiofiles.tempfile.TemporaryDirectory() as tmpdir:
-                manifest = await self._get_manifest(
-                    firm['url'], tmpdir
-                ) or await asyncio.to_thread(
-                    self._sync_get_manifest, firm['url'], tmpdir
+            if (
+                retries.get(firm['buildid'], 0) > now
+            ):  # If this version recently failed to save, wait until it can be retried
+                skipped.append(firm)
+                continue
+
+            pending.append(firm)
+
+        return pending, skipped, retries
+
+    async def save_firm_blobs(
+        self, user: int, device: dict, firm: dict, retried: bool
+    ) -> bool:
+        supported = await self.manifests.supports(
+            device['identifier'], firm['buildid'], device['boardconfig']
+        )
+        if supported == False:  # No build identity for this boardconfig
+            manifest = None
+        else:
+            manifest = await self.fetch_manifest(firm['url'])
+
+        if manifest and supported is None:
+            boardconfigs = await self.manifests.add(
+                device['identifier'], firm['buildid'], manifest
+            )
+            if boardconfigs is not None:
+                supported = device['boardconfig'].lower() in boardconfigs
+
+        if supported == False:
+            saved_blob = 'identity'
+        elif manifest == False:
+            saved_blob = 'manifest'
+        else:
+            async with self.scratch.workspace() as tmpdir:
+                saved_blob = await self._save_blob(
+                    user, device, firm, manifest, tmpdir
                 )
-                saved_blob = (
-                    await self._save_blob(device, firm, str(manifest), manifest.parent)
-                    if manifest != False
-                    else False
+
+        if saved_blob is None:
+            return False
+
+        if saved_blob is True:
+            if retried:
+                await self.failures.clear(device['ecid'], firm['buildid'])
+
+            return True
+
+        delay = await self.failures.record(device['ecid'], firm['buildid'], saved_blob)
+        self.bot.logger.debug(
+            f"Failed to save SHSH blobs for {firm['buildid']} on ECID {self.censor_ecid(device['ecid'])} ({saved_blob}), retrying in {delay} seconds."
+        )
+        return False
+
+    async def record_saved_blobs(self, user: int, ecid: str, firm: dict) -> None:
+        # Other jobs for the same user may have saved blobs since this one was planned
+        async with self.user_locks.hold(user):
+            async with self.bot.db.execute(
+                'SELECT devices from autotss WHERE user = ?', (user,)
+            ) as cursor:
+                row = await cursor.fetchone()
+
+            if row is None:  # User removed all of their devices mid-run
+                return
+
+            devices = ujson.loads(row[0])
+            for device in devices:
+                if device['ecid'] == ecid and not any(
+                    saved_firm['buildid'] == firm['buildid']
+                    for saved_firm in device['saved_blobs']
+                ):
+                    device['saved_blobs'].append(
+                        {x: y for x, y in firm.items() if x not in ('url', 'signed')}
+                    )
+
+            await self.bot.db.execute(
+                'UPDATE autotss SET devices = ? WHERE user = ?',
+                (ujson.dumps(devices), user),
+            )
+            await self.bot.db.commit()
+
+    async def record_first_blob(self, ecid: str) -> None:
+        now = await asyncio.to_thread(time.time)
+        async with self.bot.db.execute(
+            'UPDATE first_blobs SET saved = ? WHERE ecid = ? AND saved IS NULL',
+            (now, ecid),
+        ) as cursor:
+            first = cursor.rowcount == 1
+
+        await self.bot.db.commit()
+        if not first:
+            return
+
+        async with self.bot.db.execute(
+            'SELECT saved - added FROM first_blobs WHERE ecid = ?', (ecid,)
+        ) as cursor:
+            elapsed = (await cursor.fetchone())[0]
+
+        self.bot.logger.info(
+            f'Saved the first SHSH blob for new ECID {self.censor_ecid(ecid)} in {elapsed:.1f} seconds.'
+        )
+
+    async def first_blob_times(self, limit: int = 100) -> list[float]:
+        async with self.bot.db.execute(
+            'SELECT saved - added FROM first_blobs WHERE saved IS NOT NULL ORDER BY added DESC LIMIT ?',
+            (limit,),
+        ) as cursor:
+            return [row[0] for row in await cursor.fetchall()]
+
+    async def _run_save_job(
+        self,
+        user: int,
+        device: dict,
+        firm: dict,
+        retried: bool,
+        progress: Optional[SaveProgress] = None,
+    ) -> bool:
+        # Jobs queued before the device was removed have nothing left to save for
+        if not await self.has_device(device['ecid']):
+            return False
+
+        if progress is not None:
+            progress.start(device['name'])
+
+        try:
+            if not await self.save_firm_blobs(user, device, firm, retried):
+                return False
+
+            await self.record_saved_blobs(user, device['ecid'], firm)
+            await self.record_first_blob(device['ecid'])
+        finally:
+            if progress is not None:
+                progress.finish(device['name'])
+
+        return True
+
+    async def save_all_blobs(
+        self,
+        firms: dict[str, list[dict]],
+        priorities: dict[tuple[str, str], int],
+        signed_since: dict[tuple[str, str], float],
+        default: int = ROUTINE,
+    ) -> dict:
+        async with self.bot.db.execute(
+            'SELECT user, devices from autotss WHERE enabled = ?', (True,)
+        ) as cursor:
+            data = await cursor.fetchall()
+
+        now = await asyncio.to_thread(time.time)
+        jobs = []
+        for user, devices in data:
+            for device in ujson.loads(devices):
+                pending, _, retries = await self.pending_firms(
+                    device, firms.get(device['identifier'], [])
                 )
+                for firm in pending:
+                    key = (device['identifier'], firm['buildid'])
+                    jobs.append(
+                        (
+                            priorities.get(key, default),
+                            signed_since.get(key, now),
+                            (device['ecid'], firm['buildid']),
+                            self._run_save_job,
+                            user,
+                            device,
+                            firm,
+                            firm['buildid'] in retries,
+                        )
+                    )
+
+        results, completions = await run_jobs(self.scheduler, jobs)
+
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            self.bot.logger.error(
+                f"{len(errors)} SHSH blob save job{'s' if len(errors) != 1 else ''} raised an exception, first: {errors[0]!r}"
+            )
+
+        saved = [job for job, result in zip(jobs, results) if result is True]
+        return {
+            'blobs_saved': len(saved),
+            'devices_saved': len({job[2][0] for job in saved}),
+            'blobs_failed': len(jobs) - len(saved),
+            'completions': completions,
+        }
 
-            if saved_blob is True:
-                device['saved_blobs'].append(
-                    {x: y for x, y in firm.items() if x not in ('url', 'signed')}
+    async def _queue_user_blobs(self, user: int, progress: SaveProgress) -> dict:
+        async with self.bot.db.execute(
+            'SELECT devices from autotss WHERE user = ?', (user,)
+        ) as cursor:
+            try:
+                devices = ujson.loads((await cursor.fetchone())[0])
+            except TypeError:
+                devices = []
+
+        identifiers = list({device['identifier'] for device in devices})
+        firms = dict(
+            zip(
+                identifiers,
+                await asyncio.gather(*[self.get_firms(i) for i in identifiers]),
+            )
+        )
+
+        now = await asyncio.to_thread(time.time)
+        jobs = []
+        skipped = 0
+        for device in devices:
+            pending, backoff, retries = await self.pending_firms(
+                device, firms[device['identifier']]
+            )
+            skipped += len(backoff)
+            jobs.extend(
+                (
+                    MANUAL,
+                    now,
+                    (device['ecid'], firm['buildid']),
+                    self._run_save_job,
+                    user,
+                    device,
+                    firm,
+                    firm['buildid'] in retries,
+                    progress,
                 )
-                stats['saved_blobs'].append(firm)
-            else:
-                stats['failed_blobs'].append(firm)
+                for firm in pending
+            )
+
+        def job_done(*_) -> None:
+            progress.done += 1
 
-        stats['device'] = device
+        progress.total = len(jobs)
 
-        return stats
+        # Jobs already queued by an automatic run are moved up instead of duplicated
+        results, _ = await run_jobs(self.scheduler, jobs, job_done)
+
+        saved = [job for job, result in zip(jobs, results) if result is True]
+        return {
+            'blobs_saved': len(saved),
+            'devices_saved': len({job[2][0] for job in saved}),
+            'blobs_failed': len(jobs) - len(saved),
+            'blobs_skipped': skipped,
+        }
 
-    async def save_user_blobs(self, user: int, devices: list[dict]) -> None:
-        tasks = [self.save_device_blobs(device) for device in devices]
-        data = await asyncio.gather(*tasks)
+    def queue_user_blobs(self, user: int) -> tuple[asyncio.Task, SaveProgress]:
+        # Repeated requests from the same user follow the save that's already queued
+        if user not in self._queued_saves:
+            progress = SaveProgress()
+            task = asyncio.create_task(self._queue_user_blobs(user, progress))
+            task.add_done_callback(lambda _: self._queued_saves.pop(user, None))
+            self._queued_saves[user] = (task, progress)
 
+        return self._queued_saves[user]
+
+    async def _save_new_device(self, user: int, device: dict, added: float) -> None:
         await self.bot.db.execute(
-            'UPDATE autotss SET devices = ? WHERE user = ?',
-            (ujson.dumps([d['device'] for d in data]), user),
+            'INSERT OR REPLACE INTO first_blobs(ecid, added, saved) VALUES(?,?,?)',
+            (device['ecid'], added, None),
         )
         await self.bot.db.commit()
 
-        user_stats = {
-            'blobs_saved': sum(len(d['saved_blobs']) for d in data),
-            'devices_saved': len([d for d in data if d['saved_blobs']]),
-            'devices': [d['device'] for d in data],
-        }
-
+        try:
+            firms = await self.get_firms(device['identifier'])
+            pending, _, retries = await self.pending_firms(device, firms)
+        except Exception as e:
+            self.bot.logger.error(
+                f"Failed to queue SHSH blobs for new device `{device['name']}`: {e!r}"
+            )
+            return
 
-        for d in range(len(user_stats['devices'])):
-            user_stats['devices'][d]['failed_blobs'] = data[d]['failed_blobs']
+        await run_jobs(
+            self.scheduler,
+            [
+                (
+                    MANUAL,
+                    added,
+                    (device['ecid'], firm['buildid']),
+                    self._run_save_job,
+                    user,
+                    device,
+                    firm,
+                    firm['buildid'] in retries,
+                )
+                for firm in pending
+            ],
+        )
 
-        return user_stats
+    def queue_device_blobs(self, user: int, device: dict, added: float) -> None:
+        # Builds signed now may be unsigned by the time an automatic run gets to them
+        task = asyncio.create_task(self._save_new_device(user, device, added))
+        self._device_saves.add(task)
+        task.add_done_callback(self._device_saves.discard)
 
     async def sem_call(self, func, *args):
         async with self.sem:
@@ -7,13 +7,11 @@ from views.buttons import SelectView, PaginatorView
 from views.modals import QuestionModal
 from views.selects import DropdownView
 
-import aiofiles
-import aiopath
 import asyncio
 import discord
 import ujson
-import shutil
 import textwrap
+import time
 
 
 class DeviceCog(commands.Cog, name='Device'):
@@ -88,7 +86,23 @@ class DeviceCog(commands.Cog, name='Device'):
 
         device = {}
 
-        name_check = await self.utils.check_name(name, ctx.author.id)
+        identifier = (
+            modal.answers[0].replace(' ', '').lower().replace('devicestring:', '')
+        )
+        if 'appletv' in identifier:
+            identifier = 'TV'.join(identifier.capitalize().split('tv'))
+        else:
+            identifier = 'P'.join(identifier.split('p'))
+
+        ecid = modal.answers[1].lower().removeprefix('0x')
+
+        # These checks don't depend on each other, the device's API data is shared by the rest
+        name_check, api, ecid_check = await asyncio.gather(
+            self.utils.check_name(name, ctx.author.id),
+            self.utils.fetch_ipswme_api(identifier),
+            self.utils.check_ecid(ecid),
+        )
+
         if name_check == -1:
             raise commands.BadArgument(
                 "A device's name cannot be over 20 characters long."
@@ -99,20 +113,10 @@ class DeviceCog(commands.Cog, name='Device'):
             )
         device['name'] = name
 
-        identifier = (
-            modal.answers[0].replace(' ', '').lower().replace('devicestring:', '')
-        )
-        if 'appletv' in identifier:
-            identifier = 'TV'.join(identifier.capitalize().split('tv'))
-        else:
-            identifier = 'P'.join(identifier.split('p'))
-
-        if await self.utils.check_identifier(identifier) is False:
+        if api is None:
             raise commands.BadArgument('Invalid device identifier provided.')
         device['identifier'] = identifier
 
-        ecid = modal.answers[1].lower().removeprefix('0x')
-        ecid_check = await self.utils.check_ecid(ecid)
         if ecid_check < 0:
             error = 'Invalid device ECID provided.'
             if ecid_check == -2:
@@ -123,7 +127,7 @@ class DeviceCog(commands.Cog, name='Device'):
 
         boardconfig = modal.answers[2].replace(' ', '').lower().replace('deviceid:', '')
         if (
-            await self.utils.check_boardconfig(device['identifier'], boardconfig)
+            await self.utils.check_boardconfig(device['identifier'], boardconfig, api)
             is False
         ):
             raise commands.BadArgument('Invalid device boardconfig provided.')
@@ -137,7 +141,9 @@ class DeviceCog(commands.Cog, name='Device'):
         else:
             device['generator'] = None
 
-        cpid = await self.utils.get_cpid(device['identifier'], device['boardconfig'])
+        cpid = await self.utils.get_cpid(
+            device['identifier'], device['boardconfig'], api
+        )
         if len(modal.answers[4]) > 0:
             apnonce = modal.answers[4].lower()
             if self.utils.check_apnonce(cpid, apnonce) is False:
@@ -194,18 +200,23 @@ class DeviceCog(commands.Cog, name='Device'):
         device['saved_blobs'] = []
 
         # Add device information into the database
-        devices.append(device)
+        async with self.utils.user_locks.hold(ctx.author.id):
+            async with self.bot.db.execute(
+                'SELECT devices FROM autotss WHERE user = ?', (ctx.author.id,)
+            ) as cursor:
+                row = await cursor.fetchone()
 
-        async with self.bot.db.execute(
-            'SELECT devices FROM autotss WHERE user = ?', (ctx.author.id,)
-        ) as cursor:
-            if await cursor.fetchone() is None:
+            if row is None:
+                devices = [device]
                 sql = 'INSERT INTO autotss(devices, enabled, user) VALUES(?,?,?)'
             else:
+                devices = ujson.loads(row[0]) + [device]
                 sql = 'UPDATE autotss SET devices = ?, enabled = ? WHERE user = ?'
 
-        await self.bot.db.execute(sql, (ujson.dumps(devices), True, ctx.author.id))
-        await self.bot.db.commit()
+            await self.bot.db.execute(sql, (ujson.dumps(devices), True, ctx.author.id))
+            await self.bot.db.commit()
+
+        added = await asyncio.to_thread(time.time)
 
         embed = discord.Embed(
             title='Add Device',
@@ -221,6 +232,8 @@ class DeviceCog(commands.Cog, name='Device'):
             f"User: `@{ctx.author}` has added device: `{device['name']}`"
         )
 
+        self.utils.queue_device_blobs(ctx.author.id, device, added)
+
         await self.utils.update_device_count()
 
     @device.command(name='remove', description='Remove a device from AutoTSS.')
@@ -304,24 +317,16 @@ class DeviceCog(commands.Cog, name='Device'):
         )
         await ctx.edit(embed=embed)
 
-        async with aiofiles.tempfile.TemporaryDirectory() as tmpdir:
-            tar = await self.utils.backup_blobs(
-                aiopath.AsyncPath(tmpdir), devices[num]['ecid']
-            )
-
-        if tar is not None:
-            await asyncio.to_thread(
-                shutil.rmtree,
-                aiopath.AsyncPath(f"Data/Blobs/{devices[num]['ecid']}"),
-            )
+        volumes = await self.utils.backup_blobs(
+            devices[num]['ecid'], volume_size=self.utils.upload_limit(ctx)
+        )
 
+        if volumes:
             embed = discord.Embed(
                 title='Remove Device',
                 description=f"Device `{devices[num]['name']}` removed.\nSHSH Blobs:",
             )
-            await ctx.edit(
-                embed=embed, file=discord.File(fp=tar, filename='SHSH Blobs.tar.xz')
-            )
+            await self.utils.send_archives(ctx, embed, volumes)
 
         else:
             embed = discord.Embed(
@@ -338,19 +343,32 @@ class DeviceCog(commands.Cog, name='Device'):
             f"User: `@{ctx.author}` has removed device: `{devices[num]['name']}`"
         )
 
-        devices.pop(num)
+        async with self.utils.user_locks.hold(ctx.author.id):
+            await self.utils.purge_blobs(devices[num]['ecid'])
 
-        if not devices:
-            await self.bot.db.execute(
-                'DELETE FROM autotss WHERE user = ?', (ctx.author.id,)
-            )
-        else:
-            await self.bot.db.execute(
-                'UPDATE autotss SET devices = ? WHERE user = ?',
-                (ujson.dumps(devices), ctx.author.id),
-            )
+            # Blobs may have been saved for the user's other devices in the meantime
+            async with self.bot.db.execute(
+                'SELECT devices FROM autotss WHERE user = ?', (ctx.author.id,)
+            ) as cursor:
+                row = await cursor.fetchone()
+
+            remaining = [
+                device
+                for device in (ujson.loads(row[0]) if row is not None else [])
+                if device['ecid'] != devices[num]['ecid']
+            ]
+
+            if not remaining:
+                await self.bot.db.execute(
+                    'DELETE FROM autotss WHERE user = ?', (ctx.author.id,)
+                )
+            else:
+                await self.bot.db.execute(
+                    'UPDATE autotss SET devices = ? WHERE user = ?',
+                    (ujson.dumps(remaining), ctx.author.id),
+                )
 
-        await self.bot.db.commit()
+            await self.bot.db.commit()
 
         await self.utils.update_device_count()
 
@@ -384,7 +402,7 @@ class DeviceCog(commands.Cog, name='Device'):
         for device in devices:
             num_blobs = ','.join(
                 textwrap.wrap(
-                    str(await asyncio.to_thread(self.utils.shsh_count, device['ecid']))[
+                    str(await self.utils.shsh_count(device['ecid']))[
                         ::-1
                     ],
                     3,
@@ -78,15 +78,15 @@ class ErrorHandlerCog(commands.Cog, name='ErrorHandler'):
         elif isinstance(exc, NoDevicesFound):
             embed.description = f"{'You have' if exc.user.id == ctx.author.id else f'{exc.user.mention} has'} no devices added."
 
+        elif isinstance(exc, NoNewSHSHFound):
+            embed.description = f"{'You have' if exc.user.id == ctx.author.id else f'{exc.user.mention} has'} no new SHSH blobs saved since the last download."
+
         elif isinstance(exc, NoSHSHFound):
             embed.description = f"{'You have' if exc.user.id == ctx.author.id else f'{exc.user.mention} has'} no SHSH blobs saved."
 
         elif isinstance(exc, commands.NotOwner):
             embed.description = 'You do not have permission to run this command.'
 
-        elif isinstance(exc, SavingSHSHError):
-            embed.description = "I'm automatically saving SHSH blobs right now, please wait until I'm finished to manually save SHSH blobs."
-
         elif isinstance(exc, NotWhitelisted):
             embed.description = f'AutoTSS can only be used in {exc.channel.mention}.'
 
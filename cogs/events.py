@@ -1,5 +1,7 @@
 from .botutils import UtilsCog
 from discord.ext import commands, tasks
+from utils.cluster import Lease
+from utils.scheduler import NEW, PRIORITY_NAMES, RESIGNED
 
 import asyncio
 import discord
@@ -12,12 +14,153 @@ class EventsCog(commands.Cog, name='Events'):
         self.bot = bot
 
         self.utils: UtilsCog = self.bot.get_cog('Utilities')
+        self.lease = None
+        self.prefetches = set()
+        self.lease_keeper.start()
         self.blob_saver.start()
 
+    @tasks.loop(seconds=60)
+    async def lease_keeper(self) -> None:
+        await self.bot.wait_until_ready()
+
+        if self.lease is None:
+            self.lease = Lease(self.bot.db, 'blob_saver', self.bot.cluster)
+
+        was_held = self.lease.held
+        try:
+            await self.lease.acquire()
+        except Exception as e:
+            # e.g. database is locked, stop saving since the lease may expire meanwhile
+            self.lease.held = False
+            self.bot.logger.error(f'Failed to renew the auto blob saver lease: {e!r}')
+
+        if self.lease.held and not was_held:
+            self.bot.logger.info(
+                'This process has been elected to run the auto blob saver.'
+            )
+        elif was_held and not self.lease.held:
+            self.bot.logger.warn('Lost the auto blob saver lease to another process.')
+
+    def prefetch_done(self, task: asyncio.Task) -> None:
+        self.prefetches.discard(task)
+        if task.cancelled() or task.exception() is None:
+            return
+
+        self.bot.logger.error(
+            f'Failed to prefetch a build manifest: {task.exception()!r}'
+        )
+
+    def is_release(self, identifier: str, firm: dict) -> bool:
+        if firm['signed'] == False:
+            return False
+
+        if firm not in self._api.get(identifier, []):  # Just released
+            return True
+
+        return any(  # Resigned
+            oldfirm['signed'] == False
+            for oldfirm in self._api[identifier]
+            if oldfirm['buildid'] == firm['buildid']
+        )
+
+    async def save_blobs(self, api: dict) -> None:
+        await self.bot.change_presence(
+            activity=discord.Game(name='Currently saving SHSH blobs!')
+        )
+
+        # Kept in the database so restarts and lease handovers don't reset the order
+        async with self.bot.db.execute(
+            'SELECT identifier, buildid, since FROM signed_firms'
+        ) as cursor:
+            signed_since = {
+                (identifier, buildid): since
+                for identifier, buildid, since in await cursor.fetchall()
+            }
+
+        now = await asyncio.to_thread(time.time)
+        unsigned = []
+        priorities = {}
+        for device, firms in api.items():
+            if device not in self._api.keys():  # If new device is added to the API
+                self.bot.logger.debug(f'New device has been detected: {device}.')
+
+            firm_type = 'iOS' if 'AppleTV' not in device else 'tvOS'
+            for firm in firms:
+                if firm['signed'] == False:
+                    if signed_since.pop((device, firm['buildid']), None) is not None:
+                        unsigned.append((device, firm['buildid']))
+                    continue
+
+                signed_since.setdefault((device, firm['buildid']), now)
+                if device not in self._api.keys() or not self.is_release(device, firm):
+                    continue
+
+                if firm not in self._api[device]:  # If firmware was just released
+                    self.bot.logger.debug(
+                        f"{firm_type} {firm['version']} ({firm['buildid']}) has been released, saving SHSH blobs."
+                    )
+                    priorities[device, firm['buildid']] = NEW
+
+                else:  # If firmware has been resigned
+                    self.bot.logger.debug(
+                        f"{firm_type} {firm['version']} ({firm['buildid']}) has been resigned for {device}, saving SHSH blobs."
+                    )
+                    priorities[device, firm['buildid']] = RESIGNED
+
+        self._api = api
+
+        await self.bot.db.executemany(
+            'DELETE FROM signed_firms WHERE identifier = ? AND buildid = ?', unsigned
+        )
+        await self.bot.db.executemany(
+            'INSERT OR IGNORE INTO signed_firms(identifier, buildid, since) VALUES(?,?,?)',
+            ((*key, since) for key, since in signed_since.items()),
+        )
+        await self.bot.db.commit()
+
+        self.bot.logger.debug('Saving SHSH Blobs.')
+        start_time = await asyncio.to_thread(time.time)
+        start_timeouts = self.utils.watchdog.timeouts
+        stats = await self.utils.save_all_blobs(api, priorities, signed_since)
+        finish_time = round(await asyncio.to_thread(time.time) - start_time)
+
+        timeouts = self.utils.watchdog.timeouts - start_timeouts
+        if timeouts > 0:
+            self.bot.logger.warn(
+                f"{timeouts} tsschecker invocation{'s' if timeouts != 1 else ''} timed out after {self.utils.watchdog.timeout} seconds."
+            )
+
+        blobs_saved = stats['blobs_saved']
+        devices_saved = stats['devices_saved']
+        self.bot.logger.info(
+            ' '.join(
+                (
+                    f"Saved {blobs_saved} SHSH blob{'s' if blobs_saved > 1 else ''}",
+                    f"for {devices_saved} device{'s' if devices_saved > 1 else ''}",
+                    f"in {finish_time} second{'s' if finish_time != 1 else ''}.",
+                )
+            )
+            if blobs_saved > 0
+            else 'All SHSH blobs have already been saved.'
+        )
+
+        for priority, (jobs, finished) in sorted(stats['completions'].items()):
+            self.bot.logger.info(
+                f"{jobs} {PRIORITY_NAMES[priority]} save job{'s' if jobs != 1 else ''} completed within {finished:.1f} seconds."
+            )
+
+        self.bot.logger.info('Auto blob saver finished.')
+
     @tasks.loop()
     async def blob_saver(self) -> None:
         await self.bot.wait_until_ready()
 
+        if (
+            self.lease is None or not self.lease.held
+        ):  # Only one cluster process may run the auto blob saver
+            await asyncio.sleep(60)
+            return
+
         self.bot.logger.info('Auto blob saver started.')
         async with self.bot.session.get('https://api.ipsw.me/v4/devices') as resp:
             self.bot.logger.debug('Fetched device identifiers from IPSW.me.')
@@ -45,90 +188,42 @@ class EventsCog(commands.Cog, name='Events'):
             self._api = api
             return
 
-        if self.utils.saving_blobs:
-            self.bot.logger.info('SHSH blob saver already running, sleeping for 5m.')
-            await asyncio.sleep(300)
-            return
+        async with self.bot.db.execute(
+            'SELECT devices from autotss WHERE enabled = ?', (True,)
+        ) as cursor:
+            identifiers = {
+                device['identifier']
+                for user_devices in await cursor.fetchall()
+                for device in ujson.loads(user_devices[0])
+            }
+
+        # Start fetching manifests for new and resigned firmwares right away, so saves
+        # find them cached instead of all waiting on the first download
+        for identifier in identifiers & api.keys():
+            for firm in api[identifier]:
+                if not self.is_release(identifier, firm):
+                    continue
+
+                task = asyncio.create_task(
+                    self.utils.prefetch_manifest(identifier, firm)
+                )
+                self.prefetches.add(task)
+                task.add_done_callback(self.prefetch_done)
 
-        self.bot.logger.debug('Manual SHSH blob saving is now disabled.')
-        self.utils.saving_blobs = True
-        await self.bot.change_presence(
-            activity=discord.Game(name='Currently saving SHSH blobs!')
+        await self.utils.prune_manifests(
+            [firm['url'] for firms in api.values() for firm in firms if firm['signed']]
         )
 
-        description = None
-        for device, value in api.items():
-            if device not in self._api.keys():  # If new device is added to the API
-                self.bot.logger.debug(f'New device has been detected: {device}.')
-                self._api[device] = api[device]
-                continue
-
-            firm_type = 'iOS' if 'AppleTV' not in device else 'tvOS'
-            for firm in value:
-                if firm['signed'] == True:
-                    if firm not in self._api[device]:  # If firmware was just released
-                        self.bot.logger.debug(
-                            f"{firm_type} {firm['version']} ({firm['buildid']}) has been released, saving SHSH blobs."
-                        )
-
-                    elif any(
-                        oldfirm['signed'] == False
-                        for oldfirm in self._api[device]
-                        if oldfirm['buildid'] == firm['buildid']
-                    ):  # If firmware has been resigned
-                        self.bot.logger.debug(
-                            f"{firm_type} {firm['version']} ({firm['buildid']}) has been resigned for {device}, saving SHSH blobs."
-                        )
-
-                    self.bot.logger.debug('Saving SHSH Blobs.')
-
-                    async with self.bot.db.execute(
-                        'SELECT * from autotss WHERE enabled = ?', (True,)
-                    ) as cursor:
-                        data = await cursor.fetchall()
-
-                    start_time = await asyncio.to_thread(time.time)
-                    data = await asyncio.gather(
-                        *[
-                            self.utils.sem_call(
-                                self.utils.save_user_blobs,
-                                user_data[0],
-                                ujson.loads(user_data[1]),
-                            )
-                            for user_data in data
-                        ]
-                    )
-                    finish_time = round(await asyncio.to_thread(time.time) - start_time)
-
-                    blobs_saved = sum(user['blobs_saved'] for user in data)
-                    devices_saved = sum(user['devices_saved'] for user in data)
-
-                    description = (
-                        ' '.join(
-                            (
-                                f"Saved {blobs_saved} SHSH blob{'s' if blobs_saved > 1 else ''}",
-                                f"for {devices_saved} device{'s' if devices_saved > 1 else ''}",
-                                f"in {finish_time} second{'s' if finish_time != 1 else ''}.",
-                            )
-                        )
-                        if blobs_saved > 0
-                        else 'All SHSH blobs have already been saved.'
-                    )
-
-                    break
-
-            else:
-                self._api[device] = api[device]
-
-            if description is not None:
-                self.bot.logger.info(description)
-                break
+        # Only one automatic run at a time, user locks guard the rows it writes
+        async with self.utils.runs.run() as started:
+            if started:
+                await self.save_blobs(api)
 
-        self.bot.logger.info('Auto blob saver finished.')
+        if not started:
+            self.bot.logger.info('SHSH blob saver already running, sleeping for 5m.')
+        else:
+            await self.utils.update_device_count()
 
-        self.bot.logger.debug('Manual SHSH blob saving is now allowed.')
-        self.utils.saving_blobs = False
-        await self.utils.update_device_count()
         await asyncio.sleep(300)
 
     @commands.Cog.listener()
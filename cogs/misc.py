@@ -6,6 +6,7 @@ from views.buttons import SelectView
 
 import asyncio
 import discord
+import statistics
 import sys
 import textwrap
 
@@ -68,6 +69,8 @@ class MiscCog(commands.Cog, name='Miscellaneous'):
     async def stats(self, ctx: discord.ApplicationContext) -> None:
         await ctx.defer(ephemeral=True)
 
+        first_blob_times = await self.utils.first_blob_times()
+
         embed = {
             'title': 'AutoTSS Statistics',
             'fields': [
@@ -95,7 +98,16 @@ class MiscCog(commands.Cog, name='Miscellaneous'):
                 },
                 {
                     'name': 'SHSH Blobs Saved',
-                    'value': f"**{','.join(textwrap.wrap(str(await asyncio.to_thread(self.utils.shsh_count))[::-1], 3))[::-1]}**",
+                    'value': f"**{','.join(textwrap.wrap(str(await self.utils.shsh_count())[::-1], 3))[::-1]}**",
+                    'inline': False,
+                },
+                {
+                    'name': 'Time to First SHSH Blob',
+                    'value': (
+                        f'**{statistics.median(first_blob_times):.1f} seconds** (median of the last {len(first_blob_times)} added devices)'
+                        if first_blob_times
+                        else 'No SHSH blobs saved for new devices yet.'
+                    ),
                     'inline': False,
                 },
             ],
@@ -3,20 +3,24 @@ from discord.ext import commands
 from discord import Option
 from utils.errors import *
 from views.buttons import SelectView, PaginatorView
+from utils.scheduler import SaveProgress
 from views.selects import DropdownView
 
-import aiofiles
-import aiopath
 import asyncio
 import discord
 import ujson
 import time
 
 
+# Seconds between progress edits, well within Discord's rate limits
+PROGRESS_INTERVAL = 3
+
+
 class TSSCog(commands.Cog, name='TSS'):
     def __init__(self, bot: discord.Bot):
         self.bot = bot
         self.utils: UtilsCog = self.bot.get_cog('Utilities')
+        self.reporters: set[asyncio.Task] = set()
 
     tss = discord.SlashCommandGroup('tss', 'TSS commands')
 
@@ -38,6 +42,11 @@ class TSSCog(commands.Cog, name='TSS'):
             description='User to download SHSH blobs for',
             required=False,
         ),
+        new_only: Option(
+            bool,
+            description='Only download SHSH blobs saved since your last download',
+            default=False,
+        ),
     ) -> None:
         if user is None:
             user = ctx.author
@@ -116,15 +125,22 @@ class TSSCog(commands.Cog, name='TSS'):
             ecids = [devices[0]['ecid']]
             await ctx.respond(embed=upload_embed, ephemeral=True)
 
-        async with aiofiles.tempfile.TemporaryDirectory() as tmpdir:
-            tar = await self.utils.backup_blobs(aiopath.AsyncPath(tmpdir), *ecids)
+        # Blobs saved while the archive is being built are picked up next time
+        started = await asyncio.to_thread(time.time)
+        volumes = await self.utils.backup_blobs(
+            *ecids,
+            volume_size=self.utils.upload_limit(ctx),
+            since_user=ctx.author.id if new_only else None,
+        )
+        if not volumes:
+            raise NoNewSHSHFound(user) if new_only else NoSHSHFound(user)
 
         embed = discord.Embed(
-            title='Download Blobs', description='Download your SHSH Blobs:'
-        )
-        await ctx.edit(
-            embed=embed, file=discord.File(fp=tar, filename='SHSH Blobs.tar.xz')
+            title='Download Blobs',
+            description=f"Download your {'new ' if new_only else ''}SHSH Blobs:",
         )
+        await self.utils.send_archives(ctx, embed, volumes)
+        await self.utils.catalog.mark_downloaded(ctx.author.id, ecids, started)
         self.bot.logger.info(f'User: `@{ctx.author}` has downloaded SHSH blobs.')
 
     @tss.command(name='list', description='List your saved SHSH blobs.')
@@ -209,18 +225,56 @@ class TSSCog(commands.Cog, name='TSS'):
         if not devices:
             raise NoDevicesFound(ctx.author)
 
-        if self.utils.saving_blobs:
-            raise SavingSHSHError
-
-        start_time = await asyncio.to_thread(time.time)
-        user = await self.utils.save_user_blobs(ctx.author.id, devices)
-        finish_time = round(await asyncio.to_thread(time.time) - start_time)
-
         embed = discord.Embed(
             title='Save Blobs',
             description='Saving SHSH blobs for all of your devices...',
         )
-        if user['blobs_saved'] > 0:
+        await ctx.respond(embed=embed)
+
+        # Saving continues in the background, the response is edited as jobs finish
+        task, progress = self.utils.queue_user_blobs(ctx.author.id)
+        reporter = asyncio.create_task(
+            self.report_save_progress(ctx, embed, task, progress)
+        )
+        self.reporters.add(reporter)
+        reporter.add_done_callback(self.reporters.discard)
+
+    async def report_save_progress(
+        self,
+        ctx: discord.ApplicationContext,
+        embed: discord.Embed,
+        task: asyncio.Task,
+        progress: SaveProgress,
+    ) -> None:
+        start_time = await asyncio.to_thread(time.time)
+        shown = (progress.done, progress.total, progress.current)
+        while not task.done():
+            await asyncio.wait({task}, timeout=PROGRESS_INTERVAL)
+            if task.done() or (progress.done, progress.total, progress.current) == shown:
+                continue
+
+            shown = (progress.done, progress.total, progress.current)
+            embed.description = f'Saving SHSH blobs for all of your devices... (**{progress.done}/{progress.total}**)'
+            if progress.current is not None:
+                embed.description += f'\nCurrent device: `{progress.current}`'
+
+            try:
+                await ctx.edit(embed=embed)
+            except discord.HTTPException:  # Interaction expired, keep saving regardless
+                pass
+
+        finish_time = round(await asyncio.to_thread(time.time) - start_time)
+
+        if task.cancelled():  # Bot is shutting down
+            return
+
+        user = task.result() if task.exception() is None else None
+        if user is None:
+            self.bot.logger.error(
+                f'User: `@{ctx.author}` failed to save SHSH blobs: {task.exception()!r}'
+            )
+            embed.description = 'An error occurred while saving your SHSH blobs, please try again later.'
+        elif user['blobs_saved'] > 0:
             embed.description = ' '.join(
                 (
                     f"Saved **{user['blobs_saved']} SHSH blob{'s' if user['blobs_saved'] != 1 else ''}**",
@@ -231,10 +285,18 @@ class TSSCog(commands.Cog, name='TSS'):
             self.bot.logger.info(
                 f"User: `@{ctx.author}` has saved {user['blobs_saved']} SHSH blob{'s' if user['blobs_saved'] != 1 else ''} SHSH blobs."
             )
-        else:
+        elif user['blobs_skipped'] == 0:
             embed.description = 'All SHSH blobs have already been saved for your devices.\n\n*Tip: AutoTSS will automatically save SHSH blobs for you, no command necessary!*'
+        else:
+            embed.description = 'No SHSH blobs could be saved for your devices right now.'
 
-        await ctx.respond(embed=embed)
+        if user is not None and user['blobs_skipped'] > 0:
+            embed.description += f"\n\nSkipped **{user['blobs_skipped']} build{'s' if user['blobs_skipped'] != 1 else ''}** that recently failed to save, AutoTSS will retry {'them' if user['blobs_skipped'] != 1 else 'it'} automatically."
+
+        try:
+            await ctx.edit(embed=embed)
+        except discord.HTTPException:
+            pass
 
 
 def setup(bot: discord.Bot):
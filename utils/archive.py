@@ -0,0 +1,369 @@
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import sha1
+from itertools import groupby
+from typing import BinaryIO, Callable, NamedTuple, Optional
+from utils.packs import BlobReader, blob_length
+
+import asyncio
+import lzma
+import multiprocessing
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+import zipfile
+import zlib
+
+try:
+    from compression import zstd  # Python 3.14+
+except ImportError:
+    try:
+        import zstandard as zstd
+    except ImportError:
+        zstd = None
+
+
+ARCHIVE_ROOT = 'SHSH Blobs'
+# Minimum number of uncached segments before building them in the process pool
+PARALLEL_THRESHOLD = 8
+# Headroom for codec framing when splitting volumes by uncompressed size
+VOLUME_MARGIN = 64 * 1024
+
+
+class Codec(NamedTuple):
+    extension: str
+    default_level: int
+    levels: range
+    compressor: Optional[Callable]
+
+
+def _zstd_compressor(level: int):
+    if hasattr(zstd.ZstdCompressor, 'compressobj'):  # zstandard
+        return zstd.ZstdCompressor(level=level).compressobj()
+
+    return zstd.ZstdCompressor(level=level)
+
+
+CODECS = {
+    'xz': Codec(
+        'tar.xz',
+        6,
+        range(0, 10),
+        lambda level: lzma.LZMACompressor(format=lzma.FORMAT_XZ, preset=level),
+    ),
+    'gzip': Codec(
+        'tar.gz',
+        6,
+        range(1, 10),
+        lambda level: zlib.compressobj(level, zlib.DEFLATED, 31),  # gzip container
+    ),
+    'zip': Codec('zip', 0, range(0, 1), None),  # Stored, no compression
+}
+
+if zstd is not None:
+    CODECS['zstd'] = Codec('tar.zst', 3, range(1, 23), _zstd_compressor)
+
+
+def archive_name(codec: str, part: int = 1, parts: int = 1) -> str:
+    if parts > 1:
+        return f'{ARCHIVE_ROOT}.part{part}.{CODECS[codec].extension}'
+
+    return f'{ARCHIVE_ROOT}.{CODECS[codec].extension}'
+
+
+def blob_arcname(blob: tuple, nested: bool) -> str:
+    ecid, version, buildid, apnonce, path = blob[:5]
+    parts = [
+        ARCHIVE_ROOT,
+        version,
+        buildid,
+        apnonce or 'no-apnonce',
+        path.split('/')[-1],
+    ]
+    if nested:
+        parts.insert(1, ecid)
+
+    return '/'.join(parts)
+
+
+def _write_segment(
+    blobs: list[tuple], nested: bool, codec: str, level: int, fileobj: BinaryIO
+) -> None:
+    # A segment is a compressed run of tar members with no end-of-archive marker,
+    # so segments can be concatenated into one valid multi-stream archive
+    compressor = CODECS[codec].compressor(level)
+    written = {}
+    with BlobReader() as reader:
+        for blob in blobs:
+            try:
+                data, key, mtime = reader.read(blob)
+            except FileNotFoundError:
+                continue
+
+            info = tarfile.TarInfo(blob_arcname(blob, nested))
+            info.mtime = int(mtime)
+            info.mode = 0o644
+
+            # Deduplicated blobs share their content, store repeats as hardlink members
+            if key is not None and key in written:
+                info.type = tarfile.LNKTYPE
+                info.linkname = written[key]
+                fileobj.write(compressor.compress(info.tobuf()))
+                continue
+
+            if key is not None:
+                written[key] = info.name
+
+            info.size = len(data)
+            fileobj.write(compressor.compress(info.tobuf()))
+            fileobj.write(compressor.compress(data))
+
+            remainder = info.size % tarfile.BLOCKSIZE
+            if remainder > 0:
+                fileobj.write(
+                    compressor.compress(tarfile.NUL * (tarfile.BLOCKSIZE - remainder))
+                )
+
+    fileobj.write(compressor.flush())
+
+
+def _eof(codec: str, level: int) -> bytes:
+    compressor = CODECS[codec].compressor(level)
+    return compressor.compress(tarfile.NUL * tarfile.BLOCKSIZE * 2) + compressor.flush()
+
+
+def _blob_size(blob: tuple) -> int:
+    size = blob_length(blob)
+
+    # Header blocks (including long name extensions) plus padded file data
+    return tarfile.BLOCKSIZE * 4 + -(-size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+
+
+def _split_blobs(blobs: list[tuple], limit: int) -> list[list[tuple]]:
+    chunks = []
+    chunk = []
+    size = 0
+    for blob in blobs:
+        blob_size = _blob_size(blob)
+        if chunk and size + blob_size > limit:
+            chunks.append(chunk)
+            chunk = []
+            size = 0
+
+        chunk.append(blob)
+        size += blob_size
+
+    if chunk:
+        chunks.append(chunk)
+
+    return chunks
+
+
+def _write_zip_volumes(
+    blobs: list[tuple], volume_size: Optional[int]
+) -> list[BinaryIO]:
+    nested = len({blob[0] for blob in blobs}) > 1
+    chunks = (
+        _split_blobs(blobs, volume_size - VOLUME_MARGIN) if volume_size else [blobs]
+    )
+
+    volumes = []
+    try:
+        for chunk in chunks:
+            volumes.append(volume := tempfile.TemporaryFile())
+            with zipfile.ZipFile(
+                volume, 'w', zipfile.ZIP_STORED
+            ) as archive, BlobReader() as reader:
+                for blob in chunk:
+                    try:
+                        data, _, mtime = reader.read(blob)
+                    except FileNotFoundError:
+                        continue
+
+                    archive.writestr(
+                        zipfile.ZipInfo(
+                            blob_arcname(blob, nested), time.localtime(mtime)[:6]
+                        ),
+                        data,
+                    )
+    except:
+        for volume in volumes:
+            volume.close()
+        raise
+
+    return volumes
+
+
+def _build_segment(
+    path: str, blobs: list[tuple], nested: bool, codec: str, level: int
+) -> str:
+    if os.path.isfile(path):
+        return path
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            _write_segment(blobs, nested, codec, level, f)
+
+        os.replace(tmp_path, path)
+    except:
+        os.unlink(tmp_path)
+        raise
+
+    return path
+
+
+def _build_segments(jobs: list[tuple]) -> list[str]:
+    return [_build_segment(*job) for job in jobs]
+
+
+class ArchiveCache:
+    def __init__(
+        self,
+        root: str = 'Data/Archives',
+        codec: str = 'xz',
+        level: Optional[int] = None,
+        workers: Optional[int] = None,
+    ):
+        self.root = root
+        self.codec = codec
+        self.level = level
+        self.workers = workers or os.cpu_count() or 1
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _segment_path(
+        self, blobs: list[tuple], nested: bool, codec: str, level: int
+    ) -> str:
+        # Segments are keyed on the blobs they contain, so a stale one is never reused
+        digest = sha1('\n'.join(blob[4] for blob in blobs).encode()).hexdigest()
+        return f"{self.root}/{blobs[0][0]}/{'nested' if nested else 'flat'}-{codec}{level}-{digest}.{CODECS[codec].extension}"
+
+    def _segment_jobs(
+        self, blobs: list[tuple], codec: str, level: int, volume_size: Optional[int]
+    ) -> list[tuple]:
+        nested = len({blob[0] for blob in blobs}) > 1
+
+        jobs = []
+        for _, ecid_blobs in groupby(blobs, key=lambda blob: blob[0]):
+            ecid_blobs = list(ecid_blobs)
+            if volume_size is None:
+                chunks = [ecid_blobs]
+            else:  # Split ECIDs that could not fit in one volume into several segments
+                chunks = _split_blobs(ecid_blobs, volume_size - VOLUME_MARGIN)
+
+            jobs.extend(
+                (
+                    self._segment_path(chunk, nested, codec, level),
+                    chunk,
+                    nested,
+                    codec,
+                    level,
+                )
+                for chunk in chunks
+            )
+
+        return jobs
+
+    async def _build_parallel(self, jobs: list[tuple]) -> None:
+        if self._pool is None:
+            # Forking a threaded process can deadlock the workers on inherited locks
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+
+        # Each worker compresses a batch of independent ECID segments
+        batch_size = -(-len(jobs) // (self.workers * 4))
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(
+            *[
+                loop.run_in_executor(
+                    self._pool, _build_segments, jobs[i : i + batch_size]
+                )
+                for i in range(0, len(jobs), batch_size)
+            ]
+        )
+
+    def _assemble(
+        self, jobs: list[tuple], codec: str, level: int, volume_size: Optional[int]
+    ) -> list[BinaryIO]:
+        # Every volume is a complete archive, so each one can be extracted on its own
+        eof = _eof(codec, level)
+
+        volumes = []
+        size = 0
+        try:
+            for job in jobs:
+                path = _build_segment(*job)
+                segment_size = os.path.getsize(path)
+                if not volumes or (
+                    volume_size is not None
+                    and size + segment_size + len(eof) > volume_size
+                ):
+                    if volumes:
+                        volumes[-1].write(eof)
+
+                    # Unnamed temporary files keep memory use flat at any archive size
+                    volumes.append(tempfile.TemporaryFile())
+                    size = 0
+
+                with open(path, 'rb') as f:
+                    shutil.copyfileobj(f, volumes[-1])
+                size += segment_size
+
+            volumes[-1].write(eof)
+        except:
+            for volume in volumes:
+                volume.close()
+            raise
+
+        return volumes
+
+    async def build(
+        self,
+        blobs: list[tuple],
+        codec: str = None,
+        level: int = None,
+        volume_size: int = None,
+    ) -> list[BinaryIO]:
+        if not blobs:
+            return []
+
+        codec = codec or self.codec
+        if level is None:
+            level = self.level if codec == self.codec else None
+        if level is None or level not in CODECS[codec].levels:
+            level = CODECS[codec].default_level
+
+        if CODECS[codec].compressor is None:
+            volumes = await asyncio.to_thread(_write_zip_volumes, blobs, volume_size)
+        else:
+            jobs = await asyncio.to_thread(
+                self._segment_jobs, blobs, codec, level, volume_size
+            )
+            missing = await asyncio.to_thread(
+                lambda: [job for job in jobs if not os.path.isfile(job[0])]
+            )
+            if len(missing) >= PARALLEL_THRESHOLD and self.workers > 1:
+                await self._build_parallel(missing)
+
+            volumes = await asyncio.to_thread(
+                self._assemble, jobs, codec, level, volume_size
+            )
+
+        for volume in volumes:
+            volume.seek(0)
+
+        return volumes
+
+    async def invalidate(self, ecid: str) -> None:
+        await asyncio.to_thread(
+            shutil.rmtree, f'{self.root}/{ecid}', ignore_errors=True
+        )
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
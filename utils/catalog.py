@@ -0,0 +1,217 @@
+from typing import Optional
+from utils.fs import walk_blobs
+
+import aiosqlite
+import asyncio
+import os
+import time
+
+
+class BlobCatalog:
+    def __init__(self, db: aiosqlite.Connection, blobdir: str = 'Data/Blobs'):
+        self.db = db
+        self.blobdir = blobdir
+
+    async def add(
+        self,
+        ecid: str,
+        version: str,
+        buildid: str,
+        apnonce: Optional[str],
+        paths: list[str],
+        records: list[Optional[tuple]],
+    ) -> None:
+        saved = await asyncio.to_thread(time.time)
+        await self.db.executemany(
+            'INSERT OR REPLACE INTO blobs(ecid, version, buildid, apnonce, path, saved, sha256, size, mtime) VALUES(?,?,?,?,?,?,?,?,?)',
+            [
+                (ecid, version, buildid, apnonce, path, saved, *(record or (None,) * 3))
+                for path, record in zip(paths, records)
+            ],
+        )
+        await self.db.commit()
+
+    async def remove(self, ecid: str) -> None:
+        await self.db.execute('DELETE FROM blobs WHERE ecid = ?', (ecid,))
+        await self.db.execute('DELETE FROM downloads WHERE ecid = ?', (ecid,))
+        await self.db.commit()
+
+    async def remove_paths(self, paths: list[str]) -> None:
+        await self.db.executemany(
+            'DELETE FROM blobs WHERE path = ?', [(path,) for path in paths]
+        )
+        await self.db.commit()
+
+    async def ecids(self) -> list[str]:
+        async with self.db.execute(
+            'SELECT DISTINCT ecid FROM blobs ORDER BY ecid'
+        ) as cursor:
+            return [row[0] for row in await cursor.fetchall()]
+
+    async def packed_builds(self, ecid: str) -> dict[str, str]:
+        async with self.db.execute(
+            'SELECT buildid, MIN(version) FROM blobs WHERE ecid = ? AND pack IS NOT NULL GROUP BY buildid',
+            (ecid,),
+        ) as cursor:
+            return {row[0]: row[1] for row in await cursor.fetchall()}
+
+    async def entries(self, *ecids: str, since_user: int = None) -> list[tuple]:
+        entries = []
+
+        if since_user is None:
+            sql = 'SELECT ecid, version, buildid, apnonce, path, pack, offset, length FROM blobs WHERE ecid IN ({}) ORDER BY ecid, version, buildid, path'
+        else:  # Only blobs saved since the user last downloaded that ECID
+            sql = 'SELECT b.ecid, b.version, b.buildid, b.apnonce, b.path, b.pack, b.offset, b.length FROM blobs b LEFT JOIN downloads d ON d.ecid = b.ecid AND d.user = ? WHERE b.ecid IN ({}) AND (d.downloaded IS NULL OR b.saved > d.downloaded) ORDER BY b.ecid, b.version, b.buildid, b.path'
+
+        # Stay well under SQLite's bound parameter limit
+        for i in range(0, len(ecids), 500):
+            chunk = ecids[i : i + 500]
+            async with self.db.execute(
+                sql.format(','.join('?' * len(chunk))),
+                chunk if since_user is None else (since_user, *chunk),
+            ) as cursor:
+                entries.extend(await cursor.fetchall())
+
+        return entries
+
+    async def move_prefix(self, ecid: str, old: str, new: str) -> None:
+        await self.db.execute(
+            'UPDATE blobs SET path = ? || substr(path, ?) WHERE ecid = ? AND substr(path, 1, ?) = ?',
+            (new, len(old) + 1, ecid, len(old), old),
+        )
+        await self.db.commit()
+
+    async def unhashed(self) -> list[str]:
+        async with self.db.execute(
+            'SELECT path FROM blobs WHERE sha256 IS NULL ORDER BY path'
+        ) as cursor:
+            return [row[0] for row in await cursor.fetchall()]
+
+    async def set_records(
+        self, paths: list[str], records: list[Optional[tuple]]
+    ) -> None:
+        await self.db.executemany(
+            'UPDATE blobs SET sha256 = ?, size = ?, mtime = ? WHERE path = ?',
+            [
+                (*record, path)
+                for path, record in zip(paths, records)
+                if record is not None
+            ],
+        )
+        await self.db.commit()
+
+    async def audit_rows(self) -> list[tuple]:
+        async with self.db.execute(
+            'SELECT path, pack, offset, length, sha256, size, mtime, verified FROM blobs ORDER BY path'
+        ) as cursor:
+            return await cursor.fetchall()
+
+    async def set_verified(self, results: list[tuple], verified: float) -> None:
+        await self.db.executemany(
+            'UPDATE blobs SET sha256 = ?, size = ?, mtime = ?, verified = ? WHERE path = ?',
+            [(*result[1:], verified, result[0]) for result in results],
+        )
+        await self.db.commit()
+
+    async def unpacked(self, ecid: str, before: float) -> list[tuple]:
+        async with self.db.execute(
+            'SELECT buildid, path, sha256 FROM blobs WHERE ecid = ? AND pack IS NULL AND (saved IS NULL OR saved < ?) ORDER BY path',
+            (ecid, before),
+        ) as cursor:
+            return await cursor.fetchall()
+
+    async def pack_index(self, ecid: str) -> dict[str, tuple]:
+        async with self.db.execute(
+            'SELECT sha256, offset, length FROM blobs WHERE ecid = ? AND pack IS NOT NULL AND sha256 IS NOT NULL',
+            (ecid,),
+        ) as cursor:
+            return {row[0]: (row[1], row[2]) for row in await cursor.fetchall()}
+
+    async def set_packed(
+        self, pack: str, paths: list[str], locations: list[tuple]
+    ) -> None:
+        await self.db.executemany(
+            'UPDATE blobs SET pack = ?, offset = ?, length = ? WHERE path = ?',
+            [
+                (pack, *location, path)
+                for path, location in zip(paths, locations)
+                if location is not None
+            ],
+        )
+        await self.db.commit()
+
+    async def mark_downloaded(self, user: int, ecids: list[str], when: float) -> None:
+        await self.db.executemany(
+            'INSERT OR REPLACE INTO downloads(user, ecid, downloaded) VALUES(?,?,?)',
+            [(user, ecid, when) for ecid in ecids],
+        )
+        await self.db.commit()
+
+    async def count(self, ecid: str = None) -> int:
+        if ecid is None:
+            sql, params = 'SELECT COUNT(*) FROM blobs', ()
+        else:
+            sql, params = 'SELECT COUNT(*) FROM blobs WHERE ecid = ?', (ecid,)
+
+        async with self.db.execute(sql, params) as cursor:
+            return (await cursor.fetchone())[0]
+
+    async def rebuild(self) -> tuple[int, int]:
+        # Snapshot the catalog first, blobs saved during the walk are then on disk too
+        async with self.db.execute('SELECT path, pack FROM blobs') as cursor:
+            catalog = {row[0]: row[1] for row in await cursor.fetchall()}
+
+        disk = {blob[-1]: blob for blob in await walk_blobs(self.blobdir)}
+
+        # Packed blobs no longer have loose files on disk
+        missing = [
+            (path,)
+            for path, pack in catalog.items()
+            if path not in disk and pack is None
+        ]
+        added = [blob for path, blob in disk.items() if path not in catalog]
+
+        # Blobs found on disk are dated by when they were written
+        added = await asyncio.to_thread(
+            lambda: [(*blob, os.path.getmtime(blob[-1])) for blob in added]
+        )
+
+        # A blob may have been saved again or packed since the walk
+        missing = await asyncio.to_thread(
+            lambda: [path for path in missing if not os.path.exists(path[0])]
+        )
+
+        await self.db.executemany(
+            'DELETE FROM blobs WHERE path = ? AND pack IS NULL', missing
+        )
+        await self.db.executemany(
+            'INSERT OR IGNORE INTO blobs(ecid, version, buildid, apnonce, path, saved) VALUES(?,?,?,?,?,?)',
+            added,
+        )
+        await self.db.commit()
+
+        await self.date_blobs()
+        return len(added), len(missing)
+
+    async def date_blobs(self) -> int:
+        async with self.db.execute(
+            'SELECT path, pack FROM blobs WHERE saved IS NULL'
+        ) as cursor:
+            undated = await cursor.fetchall()
+
+        def mtimes() -> list[tuple[float, str]]:
+            dated = []
+            for path, pack in undated:
+                try:  # Packed blobs are dated by their pack
+                    dated.append((os.path.getmtime(pack or path), path))
+                except OSError:
+                    continue
+
+            return dated
+
+        # Rows cataloged before the saved column existed would never count as new
+        dated = await asyncio.to_thread(mtimes)
+        await self.db.executemany('UPDATE blobs SET saved = ? WHERE path = ?', dated)
+        await self.db.commit()
+
+        return len(dated)
@@ -0,0 +1,79 @@
+from typing import Optional
+
+import aiohttp
+import aiosqlite
+import asyncio
+import os
+import socket
+import time
+
+
+GATEWAY_URL = 'https://discord.com/api/v10/gateway/bot'
+
+
+def shard_ranges(shard_count: int, clusters: int) -> list[list[int]]:
+    clusters = max(1, min(clusters, shard_count))
+    per_cluster, remainder = divmod(shard_count, clusters)
+
+    ranges = []
+    start = 0
+    for cluster in range(clusters):
+        size = per_cluster + (1 if cluster < remainder else 0)
+        ranges.append(list(range(start, start + size)))
+        start += size
+
+    return ranges
+
+
+async def fetch_shard_count(token: str) -> Optional[int]:
+    async with aiohttp.ClientSession() as session:
+        async with session.get(
+            GATEWAY_URL, headers={'Authorization': f'Bot {token}'}
+        ) as resp:
+            if resp.status != 200:
+                return None
+
+            return (await resp.json())['shards']
+
+
+class Lease:
+    def __init__(
+        self,
+        db: aiosqlite.Connection,
+        name: str,
+        cluster: Optional[int] = None,
+        ttl: int = 180,
+    ):
+        self.db = db
+        self.name = name
+        self.ttl = ttl
+        self.holder = f'{socket.gethostname()}:{os.getpid()}:{cluster}'
+        self.held = False
+
+    async def acquire(self) -> bool:
+        now = await asyncio.to_thread(time.time)
+
+        # Only one process can win the UPDATE, SQLite serializes writers
+        await self.db.execute(
+            'INSERT OR IGNORE INTO leases(name, holder, expires) VALUES(?,?,?)',
+            (self.name, None, 0),
+        )
+        async with self.db.execute(
+            'UPDATE leases SET holder = ?, expires = ? WHERE name = ? AND (holder = ? OR expires < ?)',
+            (self.holder, now + self.ttl, self.name, self.holder, now),
+        ) as cursor:
+            self.held = cursor.rowcount == 1
+
+        await self.db.commit()
+        return self.held
+
+    async def release(self) -> None:
+        if not self.held:
+            return
+
+        await self.db.execute(
+            'UPDATE leases SET holder = ?, expires = ? WHERE name = ? AND holder = ?',
+            (None, 0, self.name, self.holder),
+        )
+        await self.db.commit()
+        self.held = False
@@ -9,10 +9,6 @@ class StopCommand(AutoTSSError):
     pass
 
 
-class SavingSHSHError(AutoTSSError):
-    pass
-
-
 class NoDevicesFound(AutoTSSError):
     def __init__(self, user: discord.User) -> None:
         super().__init__()
@@ -31,6 +27,10 @@ class NoSHSHFound(AutoTSSError):
         self.user = user
 
 
+class NoNewSHSHFound(NoSHSHFound):
+    pass
+
+
 class TooManyDevices(AutoTSSError):
     def __init__(self, max_devices: int) -> None:
         super().__init__()
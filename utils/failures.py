@@ -0,0 +1,72 @@
+import aiosqlite
+import asyncio
+import time
+
+
+# Initial retry delay (in seconds) for each failure reason, doubled on every consecutive failure
+BACKOFF_BASE = {
+    'manifest': 300,
+    'unsigned': 600,
+    'tsschecker': 300,
+    'timeout': 300,
+    'apnonce': 3600,
+    'identity': 3600,
+}
+BACKOFF_MAX = 86400
+
+
+def classify_failure(output: str) -> str:
+    output = output.lower()
+    if 'buildidentity' in output:
+        return 'identity'
+    elif 'apnonce' in output:
+        return 'apnonce'
+    elif 'not being signed' in output:
+        return 'unsigned'
+
+    return 'tsschecker'
+
+
+def backoff_delay(reason: str, attempts: int) -> int:
+    base = BACKOFF_BASE.get(reason, BACKOFF_BASE['tsschecker'])
+    return min(BACKOFF_MAX, base * 2 ** (max(attempts, 1) - 1))
+
+
+class FailureCache:
+    def __init__(self, db: aiosqlite.Connection):
+        self.db = db
+
+    async def get_retries(self, ecid: str) -> dict[str, float]:
+        async with self.db.execute(
+            'SELECT buildid, retry FROM failures WHERE ecid = ?', (ecid,)
+        ) as cursor:
+            return {buildid: retry for buildid, retry in await cursor.fetchall()}
+
+    async def record(self, ecid: str, buildid: str, reason: str) -> int:
+        async with self.db.execute(
+            'SELECT attempts FROM failures WHERE ecid = ? AND buildid = ?',
+            (ecid, buildid),
+        ) as cursor:
+            row = await cursor.fetchone()
+
+        attempts = 1 if row is None else row[0] + 1
+        delay = backoff_delay(reason, attempts)
+        retry = await asyncio.to_thread(time.time) + delay
+
+        await self.db.execute(
+            'INSERT OR REPLACE INTO failures(ecid, buildid, reason, attempts, retry) VALUES(?,?,?,?,?)',
+            (ecid, buildid, reason, attempts, retry),
+        )
+        await self.db.commit()
+
+        return delay
+
+    async def clear(self, ecid: str, buildid: str = None) -> None:
+        if buildid is None:
+            await self.db.execute('DELETE FROM failures WHERE ecid = ?', (ecid,))
+        else:
+            await self.db.execute(
+                'DELETE FROM failures WHERE ecid = ? AND buildid = ?', (ecid, buildid)
+            )
+
+        await self.db.commit()
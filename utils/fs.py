@@ -0,0 +1,190 @@
+from fnmatch import fnmatch
+from hashlib import sha1
+from typing import NamedTuple, Optional, Union
+
+import asyncio
+import os
+import shutil
+
+
+PathLike = Union[str, os.PathLike]
+
+
+class DirScan(NamedTuple):
+    dirs: list[str]
+    files: list[str]
+
+
+def _scan_dir(path: PathLike, pattern: Optional[str] = None) -> DirScan:
+    dirs = []
+    files = []
+
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):  # Skip scratch workspaces
+                    continue
+
+                if entry.is_dir():
+                    dirs.append(entry.name)
+                elif pattern is None or fnmatch(entry.name, pattern):
+                    files.append(entry.name)
+    except FileNotFoundError:
+        pass
+
+    dirs.sort()
+    files.sort()
+    return DirScan(dirs, files)
+
+
+def ecid_dirs(blobdir: PathLike, ecid: str) -> tuple[str, str]:
+    # Hashed two-level fan-out keeps directories small at large ECID counts
+    digest = sha1(ecid.encode()).hexdigest()
+    return f'{blobdir}/{digest[:2]}/{digest[2:4]}/{ecid}', f'{blobdir}/{ecid}'
+
+
+def _resolve_ecid_dir(blobdir: PathLike, ecid: str) -> str:
+    fanout, legacy = ecid_dirs(blobdir, ecid)
+    if not os.path.isdir(fanout) and os.path.isdir(legacy):  # Not migrated yet
+        return legacy
+
+    return fanout
+
+
+def _ecid_paths(blobdir: PathLike) -> list[tuple[str, str]]:
+    ecids = []
+    for name in _scan_dir(blobdir).dirs:
+        if len(name) != 2:  # ECIDs are at least 7 characters long
+            ecids.append((name, f'{blobdir}/{name}'))
+            continue
+
+        for fanout in _scan_dir(f'{blobdir}/{name}').dirs:
+            fanout_path = f'{blobdir}/{name}/{fanout}'
+            ecids.extend(
+                (ecid, f'{fanout_path}/{ecid}') for ecid in _scan_dir(fanout_path).dirs
+            )
+
+    return ecids
+
+
+def _ecid_builds(blobdir: PathLike, ecid: str) -> list[tuple[str, str]]:
+    builds = []
+    for ecid_path in ecid_dirs(blobdir, ecid):
+        for version in _scan_dir(ecid_path).dirs:
+            version_path = f'{ecid_path}/{version}'
+            for buildid in _scan_dir(version_path).dirs:
+                buildid_path = f'{version_path}/{buildid}'
+                if any(
+                    _scan_dir(f'{buildid_path}/{apnonce}', '*.shsh*').files
+                    for apnonce in _scan_dir(buildid_path).dirs
+                ):
+                    builds.append((version, buildid))
+
+    return builds
+
+
+def _walk_blobs(blobdir: PathLike) -> list[tuple]:
+    blobs = []
+
+    # Data/Blobs/{ab}/{cd}/{ecid}/{version}/{buildid}/{apnonce|no-apnonce}/*.shsh*,
+    # or Data/Blobs/{ecid}/... for ECIDs that haven't been migrated yet
+    for ecid, ecid_path in _ecid_paths(blobdir):
+        for version in _scan_dir(ecid_path).dirs:
+            version_path = f'{ecid_path}/{version}'
+            for buildid in _scan_dir(version_path).dirs:
+                buildid_path = f'{version_path}/{buildid}'
+                for apnonce in _scan_dir(buildid_path).dirs:
+                    apnonce_path = f'{buildid_path}/{apnonce}'
+                    blobs.extend(
+                        (
+                            ecid,
+                            version,
+                            buildid,
+                            apnonce if apnonce != 'no-apnonce' else None,
+                            f'{apnonce_path}/{blob}',
+                        )
+                        for blob in _scan_dir(apnonce_path, '*.shsh*').files
+                    )
+
+    return blobs
+
+
+def _move_files(
+    src: PathLike, dest: PathLike, pattern: Optional[str] = None
+) -> list[str]:
+    files = _scan_dir(src, pattern).files
+    if not files:
+        return files
+
+    os.makedirs(dest, exist_ok=True)
+    for name in files:
+        os.replace(os.path.join(src, name), os.path.join(dest, name))
+
+    return files
+
+
+def _migrate_ecid_dir(blobdir: PathLike, ecid: str) -> bool:
+    fanout, legacy = ecid_dirs(blobdir, ecid)
+    if not os.path.isdir(legacy):
+        return False
+
+    if not os.path.isdir(fanout):
+        os.makedirs(os.path.dirname(fanout), exist_ok=True)
+        os.rename(legacy, fanout)
+        return True
+
+    # Blobs were saved to both layouts, merge the legacy tree into the fan-out one
+    for root, _, files in os.walk(legacy):
+        dest = os.path.join(fanout, os.path.relpath(root, legacy))
+        os.makedirs(dest, exist_ok=True)
+        for name in files:
+            os.replace(os.path.join(root, name), os.path.join(dest, name))
+
+    shutil.rmtree(legacy, ignore_errors=True)
+    return True
+
+
+def _remove_files(path: PathLike, names: list[str]) -> None:
+    for name in names:
+        try:
+            os.unlink(os.path.join(path, name))
+        except FileNotFoundError:
+            pass
+
+
+async def scan_dir(path: PathLike, pattern: Optional[str] = None) -> DirScan:
+    return await asyncio.to_thread(_scan_dir, path, pattern)
+
+
+async def resolve_ecid_dir(blobdir: PathLike, ecid: str) -> str:
+    return await asyncio.to_thread(_resolve_ecid_dir, blobdir, ecid)
+
+
+async def ecid_paths(blobdir: PathLike) -> list[tuple[str, str]]:
+    return await asyncio.to_thread(_ecid_paths, blobdir)
+
+
+async def ecid_builds(blobdir: PathLike, ecid: str) -> list[tuple[str, str]]:
+    return await asyncio.to_thread(_ecid_builds, blobdir, ecid)
+
+
+async def legacy_ecids(blobdir: PathLike) -> list[str]:
+    return [name for name in (await scan_dir(blobdir)).dirs if len(name) != 2]
+
+
+async def migrate_ecid_dir(blobdir: PathLike, ecid: str) -> bool:
+    return await asyncio.to_thread(_migrate_ecid_dir, blobdir, ecid)
+
+
+async def walk_blobs(blobdir: PathLike) -> list[tuple]:
+    return await asyncio.to_thread(_walk_blobs, blobdir)
+
+
+async def move_files(
+    src: PathLike, dest: PathLike, pattern: Optional[str] = None
+) -> list[str]:
+    return await asyncio.to_thread(_move_files, src, dest, pattern)
+
+
+async def remove_files(path: PathLike, names: list[str]) -> None:
+    await asyncio.to_thread(_remove_files, path, names)
@@ -0,0 +1,86 @@
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import sha256
+from typing import NamedTuple
+from utils.packs import BlobReader
+
+import asyncio
+import multiprocessing
+import os
+
+
+class AuditResult(NamedTuple):
+    checked: int
+    skipped: int
+    hashed_bytes: int
+    verified: list[tuple]
+    mismatched: list[str]
+    missing: list[str]
+
+
+def _verify(rows: list[tuple], full: bool) -> list[tuple]:
+    results = []
+    with BlobReader() as reader:
+        for path, pack, offset, length, digest, size, mtime, verified in rows:
+            try:
+                if pack is None:
+                    stat = os.stat(path)
+                    unchanged = stat.st_size == size and stat.st_mtime == mtime
+                else:  # Packed data can't change without the pack changing too
+                    stat = os.stat(pack)
+                    unchanged = verified is not None and stat.st_mtime <= verified
+
+                if not full and digest is not None and unchanged:
+                    results.append((path, 'skipped'))
+                    continue
+
+                data, _, _ = reader.read(
+                    (None, None, None, None, path, pack, offset, length)
+                )
+            except FileNotFoundError:
+                results.append((path, 'missing'))
+                continue
+
+            actual = sha256(data).hexdigest()
+            results.append(
+                (
+                    path,
+                    'ok' if digest is None or actual == digest else 'mismatch',
+                    actual,
+                    len(data),
+                    stat.st_mtime if pack is None else mtime,
+                )
+            )
+
+    return results
+
+
+async def audit(
+    rows: list[tuple], workers: int = None, full: bool = False
+) -> AuditResult:
+    # Small batches keep every worker busy until the end of the run
+    workers = workers or os.cpu_count() or 1
+    batch_size = max(1, min(512, -(-len(rows) // (workers * 4))))
+
+    loop = asyncio.get_running_loop()
+    pool = ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context('spawn')
+    )
+    try:
+        batches = await asyncio.gather(
+            *[
+                loop.run_in_executor(pool, _verify, rows[i : i + batch_size], full)
+                for i in range(0, len(rows), batch_size)
+            ]
+        )
+    finally:
+        await asyncio.to_thread(pool.shutdown, cancel_futures=True)
+
+    results = [result for batch in batches for result in batch]
+    return AuditResult(
+        checked=len([r for r in results if r[1] in ('ok', 'mismatch')]),
+        skipped=len([r for r in results if r[1] == 'skipped']),
+        hashed_bytes=sum(r[3] for r in results if r[1] in ('ok', 'mismatch')),
+        verified=[(r[0], *r[2:]) for r in results if r[1] == 'ok'],
+        mismatched=[r[0] for r in results if r[1] == 'mismatch'],
+        missing=[r[0] for r in results if r[1] == 'missing'],
+    )
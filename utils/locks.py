@@ -0,0 +1,120 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+from utils.cluster import Lease
+
+import aiosqlite
+import asyncio
+import time
+
+
+async def _renew(leases: list[Lease], ttl: int) -> None:
+    while True:
+        await asyncio.sleep(ttl / 3)
+        for lease in leases:
+            try:
+                await lease.acquire()
+            except Exception:  # Try again next time, the lease outlives a few misses
+                pass
+
+
+class UserLocks:
+    def __init__(
+        self, db: aiosqlite.Connection, cluster: Optional[int] = None, ttl: int = 60
+    ):
+        self.db = db
+        self.cluster = cluster
+        self.ttl = ttl
+        self._locks: dict[int, asyncio.Lock] = {}
+        self._users: dict[int, int] = {}
+
+    async def _lease(self, user: int) -> Lease:
+        # Leases are per process, other clusters rewrite the same rows
+        lease = Lease(self.db, f'user:{user}', self.cluster, self.ttl)
+        while not await lease.acquire():
+            await asyncio.sleep(0.1)
+
+        return lease
+
+    @asynccontextmanager
+    async def hold(self, *users: int) -> AsyncIterator[None]:
+        # Always lock users in the same order, so multi-user holds can't deadlock
+        users = sorted(set(users))
+        for user in users:
+            self._users[user] = self._users.get(user, 0) + 1
+            self._locks.setdefault(user, asyncio.Lock())
+
+        acquired = []
+        leases = []
+        renewer = None
+        try:
+            for user in users:
+                await self._locks[user].acquire()
+                acquired.append(user)
+
+                if self.cluster is not None:  # No other process to exclude otherwise
+                    if renewer is None:
+                        renewer = asyncio.create_task(_renew(leases, self.ttl))
+
+                    leases.append(await self._lease(user))
+
+            yield
+        finally:
+            if renewer is not None:
+                renewer.cancel()
+
+            for lease in leases:
+                await lease.release()
+
+            for user in acquired:
+                self._locks[user].release()
+
+            for user in users:
+                self._users[user] -= 1
+                if self._users[user] == 0:  # Nobody holds or waits on this lock
+                    del self._users[user]
+                    del self._locks[user]
+
+
+class RunCoordinator:
+    def __init__(
+        self, db: aiosqlite.Connection, cluster: Optional[int] = None, ttl: int = 180
+    ):
+        self.db = db
+        self._lock = asyncio.Lock()
+        self._lease = (
+            Lease(db, 'auto_run', cluster, ttl) if cluster is not None else None
+        )
+
+    async def running(self) -> bool:
+        if self._lock.locked() or self._lease is None:
+            return self._lock.locked()
+
+        async with self.db.execute(
+            'SELECT expires FROM leases WHERE name = ? AND holder IS NOT NULL',
+            (self._lease.name,),
+        ) as cursor:
+            row = await cursor.fetchone()
+
+        return row is not None and row[0] > await asyncio.to_thread(time.time)
+
+    @asynccontextmanager
+    async def run(self) -> AsyncIterator[bool]:
+        if self._lock.locked():  # Checked and taken without yielding to the loop
+            yield False
+            return
+
+        async with self._lock:
+            if self._lease is None:
+                yield True
+                return
+
+            if not await self._lease.acquire():  # Another cluster is running
+                yield False
+                return
+
+            renewer = asyncio.create_task(_renew([self._lease], self._lease.ttl))
+            try:
+                yield True
+            finally:
+                renewer.cancel()
+                await self._lease.release()
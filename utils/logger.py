@@ -46,11 +46,13 @@ class WebhookLogger(logging.Handler):
 
 
 class Logger:
-    def __init__(self, bot: discord.Bot = None, url: str = None):
+    def __init__(self, bot: discord.Bot = None, url: str = None, cluster: int = None):
         stdout_log = logging.StreamHandler(sys.stdout)
         stdout_log.setFormatter(
             logging.Formatter(
-                fmt='[{asctime}] [{levelname}] {message}',
+                fmt='[{asctime}] [{levelname}] '
+                + (f'[Cluster {cluster}] ' if cluster is not None else '')
+                + '{message}',
                 datefmt='%m/%d/%y %H:%m:%S',
                 style='{',
             )
@@ -0,0 +1,99 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import aiosqlite
+import asyncio
+import multiprocessing
+import plistlib
+import ujson
+
+
+def _parse_manifest(path: str) -> Optional[dict[str, list[str]]]:
+    try:
+        with open(path, 'rb') as f:
+            manifest = plistlib.load(f)
+    except Exception:  # Corrupt or truncated manifest, let tsschecker report it
+        return None
+
+    # Map each boardconfig to the identity variants it can be restored with
+    boardconfigs = {}
+    for identity in manifest.get('BuildIdentities', []):
+        info = identity.get('Info', {})
+        if 'DeviceClass' not in info:
+            continue
+
+        variants = boardconfigs.setdefault(info['DeviceClass'].lower(), [])
+        if info.get('Variant') not in variants:
+            variants.append(info.get('Variant'))
+
+    return boardconfigs
+
+
+class ManifestIndex:
+    def __init__(self, db: aiosqlite.Connection):
+        self.db = db
+        self._cache: dict[tuple[str, str], dict[str, list[str]]] = {}
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._parses: dict[tuple[str, str], asyncio.Task] = {}
+
+    async def get(self, identifier: str, buildid: str) -> Optional[dict]:
+        if (identifier, buildid) not in self._cache:
+            async with self.db.execute(
+                'SELECT boardconfigs FROM manifests WHERE identifier = ? AND buildid = ?',
+                (identifier, buildid),
+            ) as cursor:
+                row = await cursor.fetchone()
+
+            if row is None:
+                return None
+
+            self._cache[identifier, buildid] = ujson.loads(row[0])
+
+        return self._cache[identifier, buildid]
+
+    async def add(self, identifier: str, buildid: str, path: str) -> Optional[dict]:
+        # Prefetches and save jobs often index the same build at once
+        key = (identifier, buildid)
+        if key not in self._parses:
+            self._parses[key] = asyncio.create_task(
+                self._add(identifier, buildid, path)
+            )
+            self._parses[key].add_done_callback(lambda _: self._parses.pop(key, None))
+
+        return await asyncio.shield(self._parses[key])
+
+    async def _add(self, identifier: str, buildid: str, path: str) -> Optional[dict]:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=1, mp_context=multiprocessing.get_context('spawn')
+            )
+
+        # Large manifests would stall the event loop if parsed in-process
+        boardconfigs = await asyncio.get_running_loop().run_in_executor(
+            self._pool, _parse_manifest, path
+        )
+        if boardconfigs is None:
+            return None
+
+        await self.db.execute(
+            'INSERT OR REPLACE INTO manifests(identifier, buildid, boardconfigs) VALUES(?,?,?)',
+            (identifier, buildid, ujson.dumps(boardconfigs)),
+        )
+        await self.db.commit()
+
+        self._cache[identifier, buildid] = boardconfigs
+        return boardconfigs
+
+    async def supports(
+        self, identifier: str, buildid: str, boardconfig: str
+    ) -> Optional[bool]:
+        boardconfigs = await self.get(identifier, buildid)
+        if boardconfigs is None:  # Not indexed yet
+            return None
+
+        return boardconfig.lower() in boardconfigs
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,104 @@
+from hashlib import sha256
+from typing import NamedTuple, Optional
+
+import asyncio
+import os
+import tempfile
+
+
+class BlobRecord(NamedTuple):
+    sha256: str
+    size: int
+    mtime: float
+
+
+class StoreStats(NamedTuple):
+    objects: int
+    links: int
+    stored_bytes: int
+    linked_bytes: int
+    orphans: int
+
+
+def _file_digest(path: str) -> str:
+    digest = sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+class ObjectStore:
+    def __init__(self, root: str = 'Data/Objects'):
+        self.root = root
+
+    def _object_path(self, digest: str) -> str:
+        return f'{self.root}/{digest[:2]}/{digest}'
+
+    def _ingest(self, path: str) -> Optional[BlobRecord]:
+        try:
+            digest = _file_digest(path)
+        except FileNotFoundError:
+            return None
+
+        obj = self._object_path(digest)
+        os.makedirs(os.path.dirname(obj), exist_ok=True)
+        try:
+            os.link(path, obj)  # First copy of this content becomes the object
+        except FileExistsError:
+            if not os.path.samefile(path, obj):
+                # Swap the duplicate for a hardlink to the stored object atomically
+                fd, tmp_path = tempfile.mkstemp(
+                    dir=os.path.dirname(path), suffix='.tmp'
+                )
+                os.close(fd)
+                os.unlink(tmp_path)
+                os.link(obj, tmp_path)
+                os.replace(tmp_path, path)
+        except OSError:  # Hardlinks aren't supported here, keep the plain file
+            pass
+
+        stat = os.stat(path)
+        return BlobRecord(digest, stat.st_size, stat.st_mtime)
+
+    def _ingest_all(self, paths: list[str]) -> list[Optional[BlobRecord]]:
+        return [self._ingest(path) for path in paths]
+
+    def _scan(self, collect: bool) -> StoreStats:
+        objects = links = stored_bytes = linked_bytes = orphans = 0
+
+        try:
+            fanouts = os.scandir(self.root)
+        except FileNotFoundError:
+            return StoreStats(0, 0, 0, 0, 0)
+
+        with fanouts:
+            for fanout in fanouts:
+                if not fanout.is_dir():
+                    continue
+
+                with os.scandir(fanout.path) as entries:
+                    for entry in entries:
+                        stat = entry.stat()
+                        if stat.st_nlink <= 1:  # No blob references this object anymore
+                            orphans += 1
+                            if collect:
+                                os.unlink(entry.path)
+                            continue
+
+                        objects += 1
+                        links += stat.st_nlink - 1
+                        stored_bytes += stat.st_size
+                        linked_bytes += stat.st_size * (stat.st_nlink - 1)
+
+        return StoreStats(objects, links, stored_bytes, linked_bytes, orphans)
+
+    async def ingest(self, paths: list[str]) -> list[Optional[BlobRecord]]:
+        return await asyncio.to_thread(self._ingest_all, paths)
+
+    async def stats(self) -> StoreStats:
+        return await asyncio.to_thread(self._scan, False)
+
+    async def collect(self) -> StoreStats:
+        return await asyncio.to_thread(self._scan, True)
@@ -0,0 +1,137 @@
+from typing import BinaryIO, Optional
+
+import asyncio
+import os
+
+
+class BlobReader:
+    # Reads blob rows from loose files or pack files, keeping packs open between reads
+    def __init__(self):
+        self._packs: dict[str, BinaryIO] = {}
+
+    def __enter__(self) -> 'BlobReader':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        for f in self._packs.values():
+            f.close()
+
+        self._packs.clear()
+
+    def read(self, blob: tuple) -> tuple[bytes, Optional[tuple], float]:
+        path, pack, offset, length = blob[4:8]
+        if pack is not None:
+            if pack not in self._packs:
+                self._packs[pack] = open(pack, 'rb')
+
+            f = self._packs[pack]
+            f.seek(offset)
+            return f.read(length), (pack, offset), os.fstat(f.fileno()).st_mtime
+
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            # Hardlinked blobs share content, so they are identified by inode
+            key = (stat.st_dev, stat.st_ino) if stat.st_nlink > 1 else None
+            return f.read(), key, stat.st_mtime
+
+
+def blob_length(blob: tuple) -> int:
+    if blob[5] is not None:
+        return blob[7]
+
+    try:
+        return os.path.getsize(blob[4])
+    except FileNotFoundError:
+        return 0
+
+
+class PackStore:
+    def __init__(self, root: str = 'Data/Packs', blobdir: str = 'Data/Blobs'):
+        self.root = root
+        self.blobdir = blobdir
+
+    def pack_path(self, ecid: str) -> str:
+        return f'{self.root}/{ecid}.pack'
+
+    def _append(
+        self, ecid: str, blobs: list[tuple], packed: dict[str, tuple]
+    ) -> list[Optional[tuple]]:
+        os.makedirs(self.root, exist_ok=True)
+
+        locations = []
+        with open(self.pack_path(ecid), 'ab') as f:
+            offset = f.tell()
+            for path, digest in blobs:
+                # Identical content is only stored once per pack
+                if digest is not None and digest in packed:
+                    locations.append(packed[digest])
+                    continue
+
+                try:
+                    with open(path, 'rb') as blob:
+                        data = blob.read()
+                except FileNotFoundError:
+                    locations.append(None)
+                    continue
+
+                f.write(data)
+                locations.append((offset, len(data)))
+                if digest is not None:
+                    packed[digest] = locations[-1]
+
+                offset += len(data)
+
+            # Packed data has to be durable before the loose files are removed
+            f.flush()
+            os.fsync(f.fileno())
+
+        return locations
+
+    def _discard(self, paths: list[str]) -> None:
+        blobdir = os.path.abspath(self.blobdir)
+        for path in paths:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+            # Remove directories left empty, without leaving the blob directory
+            parent = os.path.dirname(os.path.abspath(path))
+            while parent != blobdir and parent.startswith(blobdir):
+                try:
+                    os.rmdir(parent)
+                except OSError:
+                    break
+
+                parent = os.path.dirname(parent)
+
+    def _remove(self, ecid: str) -> None:
+        try:
+            os.unlink(self.pack_path(ecid))
+        except FileNotFoundError:
+            pass
+
+    def _ecids(self) -> list[str]:
+        try:
+            with os.scandir(self.root) as entries:
+                return [
+                    entry.name[: -len('.pack')]
+                    for entry in entries
+                    if entry.name.endswith('.pack')
+                ]
+        except FileNotFoundError:
+            return []
+
+    async def append(
+        self, ecid: str, blobs: list[tuple], packed: dict[str, tuple]
+    ) -> list[Optional[tuple]]:
+        return await asyncio.to_thread(self._append, ecid, blobs, packed)
+
+    async def discard(self, paths: list[str]) -> None:
+        await asyncio.to_thread(self._discard, paths)
+
+    async def ecids(self) -> list[str]:
+        return await asyncio.to_thread(self._ecids)
+
+    async def remove(self, ecid: str) -> None:
+        await asyncio.to_thread(self._remove, ecid)
@@ -0,0 +1,70 @@
+from typing import Optional
+
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+
+
+class ProcessWatchdog:
+    def __init__(self, timeout: int = 120, grace: int = 5):
+        self.timeout = timeout
+        self.grace = grace
+        self.timeouts = 0
+        self.processes: set[asyncio.subprocess.Process] = set()
+
+    async def run(self, *args: str, timeout: int = None) -> Optional[bytes]:
+        if sys.platform != 'win32':
+            # Run in a new session so the whole process group can be killed
+            kwargs = {'start_new_session': True}
+        else:
+            kwargs = {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+
+        proc = await asyncio.create_subprocess_exec(
+            *args, stdout=asyncio.subprocess.PIPE, **kwargs
+        )
+        self.processes.add(proc)
+
+        try:
+            stdout = (
+                await asyncio.wait_for(proc.communicate(), timeout or self.timeout)
+            )[0]
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            await self.kill(proc)
+            return None
+        except asyncio.CancelledError:
+            await self.kill(proc)
+            raise
+        finally:
+            self.processes.discard(proc)
+
+        return stdout
+
+    async def kill(self, proc: asyncio.subprocess.Process) -> None:
+        if proc.returncode is not None:
+            return
+
+        self._signal(proc, force=False)
+        try:
+            await asyncio.wait_for(proc.wait(), self.grace)
+        except asyncio.TimeoutError:
+            self._signal(proc, force=True)
+            await proc.wait()
+
+    def kill_all(self) -> None:
+        for proc in list(self.processes):
+            if proc.returncode is None:
+                self._signal(proc, force=True)
+
+    def _signal(self, proc: asyncio.subprocess.Process, *, force: bool) -> None:
+        try:
+            if sys.platform != 'win32':
+                os.killpg(proc.pid, signal.SIGKILL if force else signal.SIGTERM)
+            elif force:
+                proc.kill()
+            else:
+                proc.terminate()
+        except ProcessLookupError:
+            pass
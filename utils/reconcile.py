@@ -0,0 +1,53 @@
+from typing import AsyncIterator, Awaitable, Callable, NamedTuple
+
+
+class Drift(NamedTuple):
+    user: int
+    ecid: str
+    missing: list[str]
+    untracked: list[tuple[str, str]]
+
+
+class Reconciliation(NamedTuple):
+    orphans: list[str]
+    drift: list[Drift]
+
+
+async def reconcile(
+    devices: AsyncIterator[tuple[str, int, dict]],
+    disk: list[str],
+    builds: Callable[[str], Awaitable[dict[str, str]]],
+) -> Reconciliation:
+    # devices: (ecid, user, {buildid: version} from saved_blobs), streamed in ECID order
+    # disk: unique ECIDs with blobs on disk or in a pack, sorted
+    # builds: {buildid: version} present for an ECID, only looked up for ECIDs in disk
+    orphans = []
+    drift = []
+
+    d = 0
+    last_ecid = None
+    present = {}
+    async for ecid, user, saved in devices:
+        while d < len(disk) and disk[d] < ecid:
+            orphans.append(disk[d])
+            d += 1
+
+        if ecid != last_ecid:
+            on_disk = d < len(disk) and disk[d] == ecid
+            if on_disk:
+                d += 1
+
+            present = await builds(ecid) if on_disk else {}
+            last_ecid = ecid
+
+        missing = [buildid for buildid in saved if buildid not in present]
+        untracked = [
+            (version, buildid)
+            for buildid, version in present.items()
+            if buildid not in saved
+        ]
+        if missing or untracked:
+            drift.append(Drift(user, ecid, missing, untracked))
+
+    orphans.extend(disk[d:])
+    return Reconciliation(orphans, drift)
@@ -0,0 +1,147 @@
+from typing import Awaitable, Callable, Hashable, Optional
+
+import asyncio
+import itertools
+import time
+
+
+# Lower values run first
+RESIGNED = 0
+MANUAL = 1
+NEW = 2
+ROUTINE = 3
+
+PRIORITY_NAMES = {
+    RESIGNED: 'resigned',
+    MANUAL: 'manual',
+    NEW: 'new',
+    ROUTINE: 'routine',
+}
+
+
+class SaveProgress:
+    def __init__(self):
+        self.done = 0
+        self.total = 0
+        self._running: list[str] = []
+
+    @property
+    def current(self) -> Optional[str]:
+        # The device whose job started most recently and is still running
+        return self._running[-1] if self._running else None
+
+    def start(self, name: str) -> None:
+        self._running.append(name)
+
+    def finish(self, name: str) -> None:
+        self._running.remove(name)
+
+
+class JobScheduler:
+    def __init__(self, sem: asyncio.Semaphore, workers: int):
+        self.sem = sem
+        self.workers = workers
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._seq = itertools.count()
+        self._tasks: list[asyncio.Task] = []
+        self._jobs: dict[Hashable, tuple[int, asyncio.Future]] = {}
+        self._running: set[Hashable] = set()
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._worker()) for _ in range(self.workers)
+            ]
+
+    def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+
+        self._tasks.clear()
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def submit(
+        self,
+        priority: int,
+        signed_since: float,
+        func: Callable[..., Awaitable],
+        *args,
+        key: Optional[Hashable] = None,
+    ) -> asyncio.Future:
+        self.start()
+
+        if key is not None and key in self._jobs:
+            queued_priority, future = self._jobs[key]
+            if key in self._running or queued_priority <= priority:
+                return future
+
+            # Requeue at the higher priority, whichever entry runs first settles the job
+            self._jobs[key] = (priority, future)
+        else:
+            future = asyncio.get_running_loop().create_future()
+            if key is not None:
+                self._jobs[key] = (priority, future)
+                future.add_done_callback(lambda _: self._jobs.pop(key, None))
+
+        # Builds that have been signed the longest are the likeliest to be unsigned next
+        self._queue.put_nowait(
+            (priority, signed_since, next(self._seq), key, func, args, future)
+        )
+        return future
+
+    async def _worker(self) -> None:
+        while True:
+            _, _, _, key, func, args, future = await self._queue.get()
+            if future.done() or key in self._running:  # Settled by a requeued entry
+                self._queue.task_done()
+                continue
+
+            if key is not None:
+                self._running.add(key)
+
+            try:
+                # Other sem_call work draws from the same budget as scheduled jobs
+                async with self.sem:
+                    result = await func(*args)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(result)
+            finally:
+                self._running.discard(key)
+                self._queue.task_done()
+
+
+async def run_jobs(
+    scheduler: JobScheduler,
+    jobs: list[tuple],
+    on_done: Optional[Callable[[int, asyncio.Future], None]] = None,
+) -> tuple[list, dict[int, tuple[int, float]]]:
+    # jobs: (priority, signed_since, key, func, *args)
+    start_time = await asyncio.to_thread(time.time)
+    completions = {}
+
+    def record(index: int, priority: int, future: asyncio.Future) -> None:
+        count, finished = completions.get(priority, (0, 0.0))
+        completions[priority] = (count + 1, max(finished, time.time() - start_time))
+        if on_done is not None:
+            on_done(index, future)
+
+    futures = []
+    for index, (priority, signed_since, key, func, *args) in enumerate(jobs):
+        future = scheduler.submit(priority, signed_since, func, *args, key=key)
+        future.add_done_callback(
+            lambda f, index=index, priority=priority: record(index, priority, f)
+        )
+        futures.append(future)
+
+    results = await asyncio.gather(*futures, return_exceptions=True)
+    return results, completions
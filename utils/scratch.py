@@ -0,0 +1,68 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+import aiopath
+import asyncio
+import os
+import pathlib
+import shutil
+
+
+class ScratchPool:
+    def __init__(self, blobdir: str = 'Data/Blobs', root: str = 'Data/Scratch'):
+        self.blobdir = pathlib.Path(blobdir)
+        self.root = pathlib.Path(root)
+        self._free: list[pathlib.Path] = []
+        self._created = 0
+
+    def _setup(self, size: int, cluster: Optional[int]) -> None:
+        self.blobdir.mkdir(parents=True, exist_ok=True)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        if (
+            self.root.stat().st_dev != self.blobdir.stat().st_dev
+        ):  # Workspaces must share a filesystem with the blob directory for renames to be atomic
+            try:  # Other cluster processes may still have workspaces in it
+                self.root.rmdir()
+            except OSError:
+                pass
+
+            self.root = self.blobdir / '.scratch'
+
+        # Leftovers from this process' previous run are never reused
+        self.root = self.root / str(cluster or 0)
+        shutil.rmtree(self.root, ignore_errors=True)
+        self.root.mkdir(parents=True)
+
+        self._free.clear()
+        for num in range(size):
+            (path := self.root / str(num)).mkdir()
+            self._free.append(path)
+
+        self._created = size
+
+    def _clean(self, path: pathlib.Path) -> None:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path)
+                else:
+                    os.unlink(entry.path)
+
+    async def setup(self, size: int, cluster: Optional[int] = None) -> None:
+        await asyncio.to_thread(self._setup, size, cluster)
+
+    @asynccontextmanager
+    async def workspace(self) -> AsyncIterator[aiopath.AsyncPath]:
+        if self._free:
+            path = self._free.pop()
+        else:  # Pool is exhausted, grow it instead of waiting for a workspace
+            path = self.root / str(self._created)
+            self._created += 1
+            await asyncio.to_thread(path.mkdir)
+
+        try:
+            yield aiopath.AsyncPath(path)
+        finally:
+            await asyncio.to_thread(self._clean, path)
+            self._free.append(path)
@@ -0,0 +1,120 @@
+from aiohttp import web
+from hashlib import sha256
+from typing import BinaryIO, Optional
+from urllib.parse import quote
+
+import asyncio
+import hmac
+import os
+import re
+import secrets
+import shutil
+import time
+
+
+TOKEN_RE = re.compile(r'^(\d+)-[A-Za-z0-9_-]+$')
+
+
+class DownloadServer:
+    def __init__(
+        self,
+        url: str,
+        secret: bytes,
+        host: str = '0.0.0.0',
+        port: int = 8080,
+        expiry: int = 3600,
+        root: str = 'Data/Downloads',
+    ):
+        self.url = url.rstrip('/')
+        self.secret = secret
+        self.host = host
+        self.port = port
+        self.expiry = expiry
+        self.root = root
+
+        self._runner: Optional[web.AppRunner] = None
+        self._cleaner: Optional[asyncio.Task] = None
+
+    def _sign(self, token: str, filename: str) -> str:
+        return hmac.new(
+            self.secret, f'{token}/{filename}'.encode(), sha256
+        ).hexdigest()
+
+    def _publish(self, fileobj: BinaryIO, token: str, filename: str) -> None:
+        os.makedirs(f'{self.root}/{token}', exist_ok=True)
+        with open(f'{self.root}/{token}/{filename}', 'wb') as f:
+            shutil.copyfileobj(fileobj, f)
+
+        fileobj.close()
+
+    def _cleanup(self) -> None:
+        now = time.time()
+        try:
+            with os.scandir(self.root) as entries:
+                for entry in entries:
+                    match = TOKEN_RE.match(entry.name)
+                    if match is None or int(match.group(1)) < now:
+                        shutil.rmtree(entry.path, ignore_errors=True)
+        except FileNotFoundError:
+            pass
+
+    async def _cleanup_loop(self) -> None:
+        while True:
+            await asyncio.to_thread(self._cleanup)
+            await asyncio.sleep(300)
+
+    async def publish(self, files: list[tuple[str, BinaryIO]]) -> list[str]:
+        expires = int(await asyncio.to_thread(time.time)) + self.expiry
+        token = f'{expires}-{secrets.token_urlsafe(16)}'
+
+        urls = []
+        for filename, fileobj in files:
+            await asyncio.to_thread(self._publish, fileobj, token, filename)
+            urls.append(
+                f'{self.url}/blobs/{token}/{quote(filename)}?signature={self._sign(token, filename)}'
+            )
+
+        return urls
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        token = request.match_info['token']
+        filename = request.match_info['filename']
+
+        match = TOKEN_RE.match(token)
+        if match is None or '..' in filename:
+            raise web.HTTPNotFound()
+
+        if not hmac.compare_digest(
+            request.query.get('signature', ''), self._sign(token, filename)
+        ):
+            raise web.HTTPForbidden()
+
+        if int(match.group(1)) < await asyncio.to_thread(time.time):
+            raise web.HTTPGone()
+
+        path = f'{self.root}/{token}/{filename}'
+        if not await asyncio.to_thread(os.path.isfile, path):
+            raise web.HTTPNotFound()
+
+        # FileResponse handles Range requests and uses sendfile where available
+        return web.FileResponse(
+            path,
+            headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+        )
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get('/blobs/{token}/{filename}', self.handle)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+        self._cleaner = asyncio.create_task(self._cleanup_loop())
+
+    async def stop(self) -> None:
+        if self._cleaner is not None:
+            self._cleaner.cancel()
+
+        if self._runner is not None:
+            await self._runner.cleanup()